@@ -1,99 +1,274 @@
+import argparse
 import faulthandler
-import os
-import pickle
-import socket
-from threading import Thread
-
+import random
 import pygame
 
 import entities
 import utils.config as config
-from grid import Grid
-from utils.assets import Asset, AssetStore
+from grid import Grid, visible
+from net.client import NetClient
+from utils.animations import advance
+from utils.assets import AssetStore
+from utils.atlas import blit_sprites
+from utils.camera import Camera
+from utils.dirty_rects import DirtyRectRenderer
+from utils.frame_timer import FrameTimeOverlay, FrameTimer
+from utils.sprite_cache import SpriteCache
+from utils.static_layer import StaticLayer, overlapping, sprite_rects
+from utils.tilemap import load_tile_map
 
 faulthandler.enable()
 
 class GameObject:
-    def __init__(self):
+    def __init__(
+        self,
+        server_address=None,
+        dirty_rects=False,
+        frame_times=None,
+        map_name=None,
+        seed=None,
+    ):
         pygame.init()
-        # self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # self.thread = Thread(target=self.listen)
-        # self.thread.start()
-        # self.clients = {}
 
         self.screen = pygame.display.set_mode(config.RESOLUTION)
         self.sprite_size = config.GRID_SIZE / config.NUM_TILES
-        self.asset_store = AssetStore(self.sprite_size, config.GRID_SIZE)
-        self.map_name = config.MAP_NAME
+        # everything a match can show, so nothing is decoded mid-match
+        self.asset_store = AssetStore(
+            self.sprite_size,
+            config.GRID_SIZE,
+            cache=SpriteCache(),
+            preload=[("spritesheets",), ("static",)],
+        )
+        self.map_name = map_name if map_name else config.MAP_NAME
         self.user_id = 0
+        self.net = None
+        if server_address:
+            self.net = NetClient(server_address, self.asset_store)
+            self.user_id, self.map_name = self.net.connect()
         player_list = []
         player_list.append(entities.Player(self.asset_store, self.user_id, 3))
         tile_map = self.fetch_tile_map()
         if tile_map:
             self.grid = Grid(
-                config.NUM_TILES,
+                len(tile_map),
                 config.SPRITE_SIZE,
                 self.asset_store,
                 player_list,
                 tile_map,
+                rng=random.Random(seed),
             )
         else:
             raise Exception(f"tile_map {self.map_name} does not exist")
 
+        world_size = (self.grid.world_size, self.grid.world_size)
+        # the world is shown in the grid's square on the left of the screen,
+        # scrolling with our player when the map is larger than that
+        self.camera = Camera((config.GRID_SIZE, config.GRID_SIZE), world_size)
+        self.view_rect = pygame.Rect((0, 0), self.camera.rect.size)
+        screen_rect = self.screen.get_rect()
+        # screen outside the view, left black
+        self.margins = [
+            pygame.Rect(
+                self.view_rect.right,
+                0,
+                screen_rect.width - self.view_rect.right,
+                screen_rect.height,
+            ),
+            pygame.Rect(
+                0,
+                self.view_rect.bottom,
+                self.view_rect.width,
+                screen_rect.height - self.view_rect.bottom,
+            ),
+        ]
+        self.margins = [margin for margin in self.margins if margin]
+        self.follow_player()
+
+        # blocks and obstacles rarely change, they are composited onto the map
+        # chunk by chunk as they come into view and only drawn again where
+        # something overlaps them
+        self.static_layer = StaticLayer(
+            self.asset_store["static"]["maps"]["default"].image,
+            world_size,
+            [self.grid.block_group, self.grid.obstacle_group],
+            self.asset_store.atlas_areas,
+        )
+        self.renderer = None
+        if dirty_rects:
+            # what the renderer restores from: the static layer under the
+            # camera, drawn again when the camera moves
+            self.view_background = pygame.Surface(self.screen.get_size())
+            self.view_background.fill("black")
+            self.background_view = None
+            self.renderer = DirtyRectRenderer(
+                self.screen,
+                self.view_background,
+                self.asset_store.atlas_areas,
+                view=self.view_rect,
+            )
+
+        # per-phase frame times, shown with F3 and written to frame_times on
+        # exit. off unless one of those asks for it
+        self.frame_times = frame_times
+        self.frame_timer = FrameTimer(enabled=bool(frame_times))
+        # Grid.update marks its own phases
+        self.grid.frame_timer = self.frame_timer
+        self.overlay = None
+        self.overlay_rect = None
+
         self.clock = pygame.time.Clock()
         self.running = True
         self.pressed_keys = []
 
-    # def listen(self):
-    #     while True:
-    #         msg, addr = self.sock.recvfrom(1024)
-    #         message = pickle.loads(msg)
-    #         id = message[-1]
-    #
-    #         if id in self.clients: 
-    #             player = self.grid.get_player(id)
-    #             player.rect.x = message[0] 
-    #             player.rect.y = message[1] 
-    #         else: 
-    #             self.grid.addPlayer(entities.Player(self.asset_store, id, 3))
-    #             self.clients[id] = "True"
-
     def fetch_tile_map(self):
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        path = os.path.join(curr_dir, "../tilemaps/", self.map_name)
-        file = open(path, "rb")
-        tile_map = pickle.load(file)
-
-        return tile_map if tile_map else None
+        return load_tile_map(self.map_name)
 
     def update(self):
-        for _, asset_dict in self.asset_store["spritesheets"].items():
-            for _, asset in asset_dict.items():
-                if isinstance(asset, Asset) and asset.animation is not None:
-                    asset.animation.update_frame()
-        self.grid.update(self.asset_store)
-        self.grid.player_group.update(self.grid, config.GRID_SIZE, self.pressed_keys, self.user_id)
+        if self.net:
+            # the server owns the world, only our own movement is predicted
+            self.net.update(self.grid, self.pressed_keys)
+            self.frame_timer.mark("net")
+            self.grid.update_sprites()
+            self.frame_timer.mark("grid")
+        else:
+            self.update_world()
+        self.follow_player()
+        advance(
+            self.grid.animated_groups(self.cull_rect()), self.grid.clock.get_ticks()
+        )
+        self.frame_timer.mark("animation")
 
-    def draw(self):
-        self.screen.fill("black")
+    def follow_player(self):
+        player = self.grid.get_player(self.user_id)
+        if player:
+            x, y = self.net.draw_position(player) if self.net else player.rect.topleft
+            self.camera.follow((x + player.rect.width / 2, y + player.rect.height / 2))
 
-        self.screen.blit(self.asset_store["static"]["maps"]["default"].image, (0, 0))
+    def cull_rect(self):
+        # what is out of view is neither animated nor drawn; when the whole
+        # map is in view there is nothing to cull
+        if self.camera.rect.contains(self.camera.world):
+            return None
+        return self.camera.rect
 
-        self.grid.item_group.draw(self.screen)
+    def update_world(self):
+        self.grid.update(self.asset_store)
+        for player in self.grid.player_group.sprites():
+            player.update(
+                self.grid,
+                self.grid.world_size,
+                self.pressed_keys if player.id == self.user_id else [],
+            )
+        self.frame_timer.mark("players")
+
+    def named_layers(self):
+        # (name, (sprites, position)) in draw order and world coordinates, see
+        # utils/dirty_rects.py. blocks were drawn over items and obstacles over
+        # everything, so the ones overlapping those are drawn again on top of
+        # the static layer
+        view = self.cull_rect()
+        if view is None:
+            items = [(self.grid.item_group, None)]
+            layers = [
+                ("explosions", (tile_group[0], None))
+                for tile_group in self.grid.explosion_groups
+            ]
+            layers += [
+                ("bubbles", (bubble_group[0], None))
+                for bubble_group in self.grid.bubble_groups
+            ]
+            players = self.grid.player_group
+            trapped = self.grid.trapped_bubble_group
+        else:
+            # a margin for players drawn ahead of their rect
+            view = view.inflate(2 * self.grid.tile_size, 2 * self.grid.tile_size)
+            items = [(self.grid.item_group.sprites_in(view), None)]
+            layers = [
+                ("explosions", (tile_group[0].sprites_in(view), None))
+                for tile_group in self.grid.explosion_groups
+            ]
+            layers += [
+                ("bubbles", (bubble_group[0].sprites_in(view), None))
+                for bubble_group in self.grid.bubble_groups
+            ]
+            players = visible(self.grid.player_group, view)
+            trapped = visible(self.grid.trapped_bubble_group, view)
+        layers.append(
+            ("players", (players, self.net.draw_position if self.net else None))
+        )
+        layers.append(("trapped", (trapped, None)))
 
-        self.grid.block_group.draw(self.screen)
+        item_rects = sprite_rects(items)
+        dynamic_rects = item_rects + sprite_rects([layer for _, layer in layers])
+        return (
+            [("items", items[0])]
+            + [("blocks", (overlapping(self.grid.block_group, item_rects), None))]
+            + layers
+            + [
+                (
+                    "obstacles",
+                    (overlapping(self.grid.obstacle_group, dynamic_rects), None),
+                )
+            ]
+        )
 
-        for tile_group in self.grid.explosion_groups:
-            tile_group[0].draw(self.screen)
+    def layers(self):
+        return [layer for _, layer in self.named_layers()]
+
+    def draw(self):
+        view = self.camera.rect
+        changed = self.static_layer.update()
+        if self.renderer:
+            if view != self.background_view:
+                self.static_layer.draw(self.view_background, view)
+                self.background_view = view.copy()
+                self.renderer.invalidate()
+            else:
+                for rect in changed:
+                    if rect.colliderect(view):
+                        self.static_layer.draw(self.view_background, view, rect=rect)
+                        self.renderer.invalidate(self.camera.to_screen(rect))
+        self.frame_timer.mark("draw.static")
 
-        for bubble_group in self.grid.bubble_groups:
-            bubble_group[0].draw(self.screen)
+        if self.renderer:
+            layers = [
+                (sprites, self.camera.position(position))
+                for sprites, position in self.layers()
+            ]
+            self.frame_timer.mark("draw.layers")
+            self.renderer.draw(layers)
+            self.frame_timer.mark("draw.dirty_rects")
+            if self.overlay:
+                rect = self.overlay.draw(self.screen, self.frame_timer)
+                if self.overlay_rect and not rect.contains(self.overlay_rect):
+                    # the renderer puts back what a larger overlay covered
+                    self.renderer.invalidate(self.overlay_rect)
+                self.overlay_rect = rect
+                pygame.display.update(rect)
+                self.frame_timer.mark("overlay")
+            return
 
-        self.grid.player_group.draw(self.screen)
+        for margin in self.margins:
+            self.screen.fill("black", margin)
+        self.static_layer.draw(self.screen, view)
+        named_layers = self.named_layers()
+        self.frame_timer.mark("draw.layers")
 
-        self.grid.trapped_bubble_group.draw(self.screen)
+        # each layer is a single blits() call, mostly from the sheet atlases
+        self.screen.set_clip(self.view_rect)
+        for name, (sprites, position) in named_layers:
+            blit_sprites(
+                self.screen,
+                sprites,
+                self.asset_store.atlas_areas,
+                self.camera.position(position),
+            )
+            self.frame_timer.mark("draw." + name)
+        self.screen.set_clip(None)
 
-        self.grid.obstacle_group.draw(self.screen)
+        if self.overlay:
+            self.overlay.draw(self.screen, self.frame_timer)
+            self.frame_timer.mark("overlay")
 
         # # only for testing
         # pygame.draw.rect(
@@ -103,12 +278,30 @@ class GameObject:
         #     1,
         # )
         pygame.display.flip()
+        self.frame_timer.mark("flip")
+
+    def toggle_overlay(self):
+        if self.overlay:
+            self.overlay = None
+            self.overlay_rect = None
+            self.frame_timer.enabled = bool(self.frame_times)
+            if self.renderer:
+                self.renderer.invalidate()
+            return
+        # to the right of the grid, where nothing else is drawn
+        self.overlay = FrameTimeOverlay((config.GRID_SIZE + 20, 20))
+        if not self.frame_timer.enabled:
+            self.frame_timer.enabled = True
+            self.frame_timer.begin()
 
     def start(self):
         while self.running:
+            self.frame_timer.begin()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                if event.type == pygame.WINDOWEXPOSED and self.renderer:
+                    self.renderer.invalidate()
                 if event.type == pygame.KEYDOWN:
                     if (
                         event.key == pygame.K_UP
@@ -118,39 +311,18 @@ class GameObject:
                     ):
                         self.pressed_keys.append(event.key)
                     if event.key == pygame.K_SPACE:
-                        for player in self.grid.player_group.sprites():
-                            if player.id == self.user_id:
-                                player.drop_bubble(self.grid, self.asset_store)
+                        self.drop_bubble()
 
                     if event.key == pygame.K_1:
-                        for player in self.grid.player_group.sprites():
-                            if player.id == self.user_id:
-                                player.use_item(0)
+                        self.use_item(0)
                     if event.key == pygame.K_2:
-                        for player in self.grid.player_group.sprites():
-                            if player.id == self.user_id:
-                                player.use_item(1)
+                        self.use_item(1)
                     if event.key == pygame.K_3:
-                        for player in self.grid.player_group.sprites():
-                            if player.id == self.user_id:
-                                player.use_item(2)
+                        self.use_item(2)
                     if event.key == pygame.K_4:
-                        for player in self.grid.player_group.sprites():
-                            if player.id == self.user_id:
-                                player.use_item(3)
-
-                    # for player in self.grid.player_group.sprites():
-                    #     if player.id == self.user_id:
-                    #         msg = pickle.dumps(
-                    #             (
-                    #                 player.rect.x,
-                    #                 player.rect.y,
-                    #                 player.vel,
-                    #                 player.explosion_range,
-                    #                 player.num_bubbles,
-                    #             )
-                    #         )
-                    #         self.sock.sendto((msg), ("127.0.1.1", 12000))
+                        self.use_item(3)
+                    if event.key == pygame.K_F3:
+                        self.toggle_overlay()
 
                 elif event.type == pygame.KEYUP:
                     if (
@@ -160,15 +332,69 @@ class GameObject:
                         or event.key == pygame.K_LEFT
                     ):
                         self.pressed_keys.remove(event.key)
+            self.frame_timer.mark("events")
             self.update()
             self.draw()
             self.clock.tick(config.FPS)
+            self.frame_timer.mark("tick")
+            self.frame_timer.end()
         self.terminate()
 
+    def drop_bubble(self):
+        if self.net:
+            self.net.queue_drop_bubble()
+            return
+        for player in self.grid.player_group.sprites():
+            if player.id == self.user_id:
+                player.drop_bubble(self.grid, self.asset_store)
+
+    def use_item(self, idx):
+        if self.net:
+            self.net.queue_use_item(idx)
+            return
+        for player in self.grid.player_group.sprites():
+            if player.id == self.user_id:
+                player.use_item(idx)
+
     def terminate(self):
-        # will probably do more stuff here in the future
+        if self.frame_times:
+            self.frame_timer.dump(self.frame_times)
+        if self.net:
+            self.net.disconnect()
         pygame.quit()
 
 
-game = GameObject()
-game.start()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--connect", metavar="HOST:PORT", help="join a game_server.py match"
+    )
+    parser.add_argument(
+        "--dirty-rects",
+        action="store_true",
+        help="only redraw and push the parts of the screen that changed",
+    )
+    parser.add_argument(
+        "--frame-times",
+        metavar="PATH",
+        help="time each phase of every frame and write the last 600 to PATH "
+        "(.csv for one row per frame, otherwise json) on exit",
+    )
+    parser.add_argument(
+        "--map",
+        metavar="NAME",
+        help="map to play offline instead of MAP_NAME in utils/config.py",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed of an offline match, random if not given"
+    )
+    args = parser.parse_args()
+    server_address = None
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        server_address = (host, int(port))
+
+    game = GameObject(
+        server_address, args.dirty_rects, args.frame_times, args.map, args.seed
+    )
+    game.start()
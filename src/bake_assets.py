@@ -0,0 +1,34 @@
+import argparse
+import time
+
+import pygame
+
+import utils.config as config
+from utils.assets import AssetStore
+from utils.sprite_cache import SpriteCache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bake every sprite into the sprite cache ahead of the first start"
+    )
+    parser.add_argument("--cache", default=".cache/sprites")
+    args = parser.parse_args()
+
+    pygame.init()
+    # convert_alpha needs a display surface, it is never shown
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    cache = SpriteCache(args.cache)
+    start = time.perf_counter()
+    # the store is lazy, so every group is asked for up front
+    AssetStore(
+        config.GRID_SIZE / config.NUM_TILES,
+        config.GRID_SIZE,
+        cache=cache,
+        preload=[("spritesheets",), ("static",)],
+    )
+    stats = cache.stats()
+    print(
+        f"{stats['misses']} baked, {stats['hits']} already up to date "
+        f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    pygame.quit()
@@ -0,0 +1,399 @@
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# nothing is shown, the display only has to exist for convert() and drawing
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import entities
+import utils.config as config
+from BnBClone import GameObject
+from grid import Grid
+from replay import Replay
+from utils.assets import AssetStore
+from utils.clock import FixedStepClock
+from utils.entity_store import EntityStore
+from utils.sprite_cache import SpriteCache
+from utils.stats import percentile
+from utils.tilemap import load_tile_map, open_map_pack
+from utils.types import Assets, Blocks
+
+PRELOAD = [("spritesheets",), ("static",)]
+FUSE_MS = 3000
+LARGE_MAP = "large"
+
+
+class Context:
+    # what several benchmarks share, made the first time one asks for it
+    def __init__(self, replays=()):
+        self.asset_store = None
+        self.map_pack = open_map_pack()
+        self.replays = replays
+
+    def assets(self):
+        if self.asset_store is None:
+            self.asset_store = AssetStore(
+                config.SPRITE_SIZE, config.GRID_SIZE, preload=PRELOAD
+            )
+        return self.asset_store
+
+    def map_names(self):
+        return self.map_pack.names() if self.map_pack else []
+
+    def close(self):
+        if self.map_pack:
+            self.map_pack.close()
+
+
+def time_runs(repeat, run, setup=None):
+    # seconds each run took; setup is not timed and its result is passed to
+    # run. like timeit, the collector is kept out of the timed part
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return times
+
+
+def empty_map():
+    return [[None] * config.NUM_TILES for _ in range(config.NUM_TILES)]
+
+
+def new_grid(asset_store, tile_map, players=(), entity_store=None):
+    # grids are square, sized by the map rather than the config
+    if any(len(row) != len(tile_map) for row in tile_map):
+        raise ValueError("benchmark maps must be square")
+    return Grid(
+        len(tile_map),
+        config.SPRITE_SIZE,
+        asset_store,
+        list(players),
+        tile_map,
+        FixedStepClock(config.FPS),
+        entity_store,
+        random.Random(0),
+    )
+
+
+def bench_cold_assets(context, repeat):
+    # every sheet decoded, sliced and packed from the pngs
+    def run(_):
+        AssetStore(config.SPRITE_SIZE, config.GRID_SIZE, preload=PRELOAD)
+
+    return time_runs(repeat, run)
+
+
+def bench_cached_assets(context, repeat):
+    # the same from a warm sprite cache
+    path = tempfile.mkdtemp(prefix="bnb-bench-")
+    try:
+        AssetStore(
+            config.SPRITE_SIZE, config.GRID_SIZE, cache=SpriteCache(path), preload=PRELOAD
+        )
+
+        def run(_):
+            AssetStore(
+                config.SPRITE_SIZE,
+                config.GRID_SIZE,
+                cache=SpriteCache(path),
+                preload=PRELOAD,
+            )
+
+        return time_runs(repeat, run)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_grid_construction(map_name):
+    def bench(context, repeat):
+        asset_store = context.assets()
+        tile_map = load_tile_map(map_name, context.map_pack)
+        # the whole map has to be built, not some corner of it
+        blocks = sum(
+            1 for row in tile_map for tile in row if tile and tile[0] == Assets.BLOCKS
+        )
+        built = len(new_grid(asset_store, tile_map).block_group)
+        assert built == blocks, f"{map_name}: built {built} of {blocks} blocks"
+        return time_runs(repeat, lambda _: new_grid(asset_store, tile_map))
+
+    return bench
+
+
+def bench_chain_reaction(num_bubbles, explosion_range=7):
+    # num_bubbles dropped side by side on an empty map, so they all join one
+    # chain, then the fuse runs out and the whole chain goes off
+    def bench(context, repeat):
+        asset_store = context.assets()
+        tiles = [
+            (row, col) for row in range(config.NUM_TILES) for col in range(config.NUM_TILES)
+        ][:num_bubbles]
+
+        def run(grid):
+            for row, col in tiles:
+                grid.add_bubble(
+                    grid.bubble_pool.acquire(asset_store, row, col, 0, explosion_range)
+                )
+                grid.toggle_bubble(row, col)
+            grid.clock.frame = math.ceil(FUSE_MS / grid.clock.step)
+            grid.update(asset_store)
+
+        return time_runs(repeat, run, lambda: new_grid(asset_store, empty_map()))
+
+    return bench
+
+
+def bench_dense_collision(context, repeat, num_queries=1000):
+    # a map of nothing but blocks, queried from spread out positions
+    asset_store = context.assets()
+    tile_map = [
+        [(Assets.BLOCKS, Blocks.DEFAULT)] * config.NUM_TILES
+        for _ in range(config.NUM_TILES)
+    ]
+    grid = new_grid(asset_store, tile_map)
+    player = entities.Player(asset_store, 0, 3)
+    rng = random.Random(0)
+    limit = config.GRID_SIZE - config.SPRITE_SIZE
+    positions = [
+        (rng.uniform(0, limit), rng.uniform(0, limit)) for _ in range(num_queries)
+    ]
+
+    def run(_):
+        for position in positions:
+            player.rect.topleft = position
+            player.update_hitbox()
+            player.is_collide(grid.obstacle_group, grid.block_group)
+
+    return time_runs(repeat, run)
+
+
+def bench_busy_update(columns, size=64, num_players=32, spacing=4):
+    # Grid.update on a tick where nothing goes off, with explosions burning
+    # from one set of bubbles and a second set still lit. columns runs it
+    # with an EntityStore
+    def bench(context, repeat):
+        asset_store = context.assets()
+        rng = random.Random(0)
+        players = [entities.Player(asset_store, idx, 3) for idx in range(num_players)]
+        grid = new_grid(
+            asset_store,
+            [[None] * size for _ in range(size)],
+            players,
+            EntityStore() if columns else None,
+        )
+        limit = grid.world_size - config.SPRITE_SIZE
+        for player in players:
+            player.rect.topleft = (rng.uniform(0, limit), rng.uniform(0, limit))
+            player.update_hitbox()
+
+        def drop(offset):
+            for row in range(offset, size, spacing):
+                for col in range(offset, size, spacing):
+                    grid.add_bubble(
+                        grid.bubble_pool.acquire(asset_store, row, col, 0, 1)
+                    )
+                    grid.toggle_bubble(row, col)
+
+        drop(0)
+        grid.clock.frame = math.ceil(FUSE_MS / grid.clock.step)
+        grid.update(asset_store)
+        drop(spacing // 2)
+        return time_runs(repeat, lambda _: grid.update(asset_store))
+
+    return bench
+
+
+def bench_draw(dirty_rects, map_name=None, warmup=240, frames=300):
+    # one sample per frame, of GameObject.draw alone, while a scripted player
+    # walks a square and drops a bubble every 50 frames
+    def bench(context, repeat):
+        game = GameObject(dirty_rects=dirty_rects, map_name=map_name, seed=0)
+        game.grid.clock = FixedStepClock(config.FPS)
+        keys = [pygame.K_RIGHT, pygame.K_DOWN, pygame.K_LEFT, pygame.K_UP]
+        times = []
+        for frame in range(warmup + frames * repeat):
+            game.grid.clock.tick()
+            if frame % 50 == 0:
+                game.drop_bubble()
+            game.pressed_keys[:] = [keys[(frame // 40) % len(keys)]]
+            game.update()
+            start = time.perf_counter()
+            game.draw()
+            if frame >= warmup:
+                times.append(time.perf_counter() - start)
+        return times
+
+    return bench
+
+
+def bench_replay(path):
+    # a recorded match played back from its first keyframe, the simulation
+    # alone on real inputs
+    def bench(context, repeat):
+        replay = Replay(path)
+        return time_runs(repeat, replay.play, replay.start)
+
+    return bench
+
+
+def benchmarks(context):
+    # (name, bench, repeat) in the order they run
+    suite = [
+        ("assets.cold", bench_cold_assets, 5),
+        ("assets.cached", bench_cached_assets, 5),
+    ]
+    for map_name in context.map_names():
+        suite.append(
+            (f"grid.construct.{map_name}", bench_grid_construction(map_name), 100)
+        )
+    for num_bubbles in (10, 50, 200):
+        suite.append(
+            (f"chain.{num_bubbles}", bench_chain_reaction(num_bubbles), 50)
+        )
+    suite.append(("collide.dense_blocks", bench_dense_collision, 50))
+    suite.append(("update.busy.sprites", bench_busy_update(False), 200))
+    suite.append(("update.busy.columns", bench_busy_update(True), 200))
+    suite.append(("draw.full", bench_draw(False), 1))
+    suite.append(("draw.dirty_rects", bench_draw(True), 1))
+    if LARGE_MAP in context.map_names():
+        # the camera scrolls and most of the map is culled
+        suite.append(("draw.large.full", bench_draw(False, LARGE_MAP), 1))
+        suite.append(("draw.large.dirty_rects", bench_draw(True, LARGE_MAP), 1))
+    for path in context.replays:
+        name = os.path.splitext(os.path.basename(path))[0]
+        suite.append((f"replay.{name}", bench_replay(path), 5))
+    return suite
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        "samples": len(times),
+        "min_ms": 1000 * times[0],
+        "median_ms": 1000 * percentile(times, 0.50),
+        "mean_ms": 1000 * sum(times) / len(times),
+        "p95_ms": 1000 * percentile(times, 0.95),
+        "max_ms": 1000 * times[-1],
+    }
+
+
+def run_suite(only=None, repeat=None, replays=()):
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    context = Context(replays)
+    results = {}
+    try:
+        for name, bench, default_repeat in benchmarks(context):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            results[name] = summarize(bench(context, repeat or default_repeat))
+            print(f"{name:<32} median {results[name]['median_ms']:10.3f} ms", flush=True)
+    finally:
+        context.close()
+        pygame.quit()
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "video_driver": os.environ.get("SDL_VIDEODRIVER"),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # median against the baseline's median, per benchmark in both
+    comparison = {}
+    for name, stats in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            continue
+        ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else None
+        if ratio is None:
+            status = "unknown"
+        elif ratio > 1 + tolerance:
+            status = "slower"
+        elif ratio < 1 - tolerance:
+            status = "faster"
+        else:
+            status = "same"
+        comparison[name] = {
+            "baseline_median_ms": base["median_ms"],
+            "median_ms": stats["median_ms"],
+            "ratio": ratio,
+            "status": status,
+        }
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Headless benchmarks of asset loading, simulation, collision and drawing"
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        metavar="PREFIX",
+        help="run only benchmarks whose name starts with PREFIX, can be repeated",
+    )
+    parser.add_argument(
+        "--repeat", type=int, help="runs per benchmark instead of each one's default"
+    )
+    parser.add_argument(
+        "--replay",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="also time playing back this replay.py recording, can be repeated",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "--baseline", help="compare against results saved earlier with --output"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="how much slower than the baseline median counts as a regression",
+    )
+    args = parser.parse_args()
+
+    results = run_suite(args.only, args.repeat, args.replay)
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        results["baseline"] = args.baseline
+        results["comparison"] = compare(results, baseline, args.tolerance)
+        for name, entry in results["comparison"].items():
+            print(
+                f"{name:<32} {entry['baseline_median_ms']:10.3f} -> "
+                f"{entry['median_ms']:10.3f} ms  {entry['status']}"
+            )
+        missing = sorted(set(baseline["benchmarks"]) - set(results["benchmarks"]))
+        if missing:
+            print(f"not run: {', '.join(missing)}")
+        if any(entry["status"] == "slower" for entry in results["comparison"].values()):
+            exit_code = 1
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+    sys.exit(exit_code)
@@ -0,0 +1,34 @@
+import random
+
+import pygame
+
+MOVE_KEYS = (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT)
+
+
+class RandomBot:
+    def __init__(
+        self,
+        player_id,
+        rng=None,
+        turn_interval=(20, 90),
+        drop_chance=0.01,
+        item_chance=0.002,
+    ):
+        self.player_id = player_id
+        self.rng = rng if rng else random.Random()
+        self.turn_interval = turn_interval
+        self.drop_chance = drop_chance
+        self.item_chance = item_chance
+        self.ticks_to_turn = 0
+
+    def act(self, simulation):
+        if self.ticks_to_turn <= 0:
+            key = self.rng.choice(MOVE_KEYS + (None,))
+            simulation.set_pressed_keys(self.player_id, [key] if key else [])
+            self.ticks_to_turn = self.rng.randint(*self.turn_interval)
+        self.ticks_to_turn -= 1
+
+        if self.rng.random() < self.drop_chance:
+            simulation.drop_bubble(self.player_id)
+        if self.rng.random() < self.item_chance:
+            simulation.use_item(self.player_id, 0)
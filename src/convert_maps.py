@@ -0,0 +1,42 @@
+import argparse
+import os
+import pickle
+
+from utils import tilemap
+
+# pickled maps predate the binary format; only run this on maps you made
+
+
+def convert(path):
+    with open(path, "rb") as file:
+        tile_map = pickle.load(file)
+    map_name = os.path.basename(path)
+    tilemap.save_tile_map(map_name, tile_map)
+    # read it back so a bad conversion fails here rather than in game
+    if tilemap.load_tile_map(map_name) != tile_map:
+        raise tilemap.TileMapError(f"{map_name} did not survive conversion")
+    return map_name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert pickled tile maps to the binary map format and "
+        "rebuild the map pack"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="pickled maps to convert, defaults to every extensionless file "
+        "in tilemaps/",
+    )
+    args = parser.parse_args()
+
+    paths = args.paths or [
+        os.path.join(tilemap.TILEMAP_DIR, name)
+        for name in sorted(os.listdir(tilemap.TILEMAP_DIR))
+        if "." not in name
+    ]
+    for path in paths:
+        print(f"converted {convert(path)}")
+    tilemap.build_map_pack()
+    print(f"wrote {os.path.normpath(tilemap.MAP_PACK_PATH)}")
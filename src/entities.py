@@ -1,9 +1,9 @@
-import random
 from enum import Enum
 
 import pygame
 
-from item import BubbleItem, SpeedShoeItem, NeedleItem
+from utils.pool import PooledSprite
+from utils.tile_group import TileGroup
 from utils.types import Assets, Bubble_Trapped, Bubbles, Characters, Explosions, Items
 
 
@@ -15,52 +15,54 @@ class EntityObject(pygame.sprite.Sprite):
         self.rect = self.image.get_rect()
 
 
-class TrappedBubble(pygame.sprite.Sprite):
-    def __init__(self, asset_store, player, time_spawned):
+class TrappedBubble(PooledSprite):
+    def __init__(self, asset_store, player, clock):
         super(TrappedBubble, self).__init__()
+        self.reset(asset_store, player, clock)
+
+    def reset(self, asset_store, player, clock):
         self.asset_store = asset_store
         self.asset = self.asset_store["spritesheets"][Assets.BUBBLE_TRAPPED][
             Bubble_Trapped.DEFAULT
         ]
         self.player = player
-        self.image = pygame.transform.smoothscale_by(
-            self.asset.get_current_frame(), 1.3
-        )
+        self.clock = clock
+        self.time_spawned = self.clock.get_ticks()
+        self.animation = self.asset.start_animation(scale=1.3)
+        self.image = self.animation.frame(self.time_spawned)
         self.rect = self.image.get_rect()
         self.rect.centerx = self.player.rect.centerx
         self.rect.centery = self.player.rect.centery
-        self.time_spawned = time_spawned
 
     def update(self):
         if self.player.is_trapped:
             self.rect.centerx = self.player.rect.centerx
             self.rect.centery = self.player.rect.centery
 
-            self.image = pygame.transform.smoothscale_by(
-                self.asset.get_current_frame(), 1.3
-            )
-            time_elapsed = pygame.time.get_ticks()
+            time_elapsed = self.clock.get_ticks()
 
             if time_elapsed - self.time_spawned <= 1000:
-                self.image.set_alpha(190)
+                alpha_value = 190
             elif time_elapsed - self.time_spawned <= 5000:
                 alpha_increment_per_ms = (255 - 190) / 4000
                 elapsed_since_transition = time_elapsed - self.time_spawned - 1000
                 alpha_value = min(
                     255, 190 + alpha_increment_per_ms * elapsed_since_transition
                 )
-                self.image.set_alpha(alpha_value)
             else:
                 self.player.kill()
                 self.kill()
+                return
+
+            self.animation.alpha = alpha_value
         else:
             self.kill()
 
 
 class Obstacle(pygame.sprite.Sprite):
-    obstacles = {}
-
-    def __init__(self, asset_store, row, col, obstacle_type, obstacle_name, tile_size):
+    def __init__(
+        self, asset_store, row, col, obstacle_type, obstacle_name, tile_size, obstacles
+    ):
         super(Obstacle, self).__init__()
         self.asset_store = asset_store
         self.asset = self.asset_store["static"][obstacle_type][obstacle_name]
@@ -80,49 +82,41 @@ class Obstacle(pygame.sprite.Sprite):
             self.col * tile_size, self.row * tile_size, tile_size, tile_size
         )
 
-        Obstacle.obstacles[(row, col)] = self
-
-    def update(self):  # type: ignore
-        self.image = self.asset.image
-
-    @classmethod
-    def get_obstacle(cls, row, col):
-        return cls.obstacles.get((row, col), None)
+        self.obstacles = obstacles
+        self.obstacles[(row, col)] = self
 
 
 class Block(Obstacle):
-    def __init__(self, asset_store, row, col, block_name, tile_size):
+    def __init__(self, asset_store, row, col, block_name, tile_size, obstacles):
         super(Block, self).__init__(
-            asset_store, row, col, Assets.BLOCKS, block_name, tile_size
+            asset_store, row, col, Assets.BLOCKS, block_name, tile_size, obstacles
         )
 
-    def update(self):  # type: ignore
-        self.image = self.asset.image
-
-    def explode(self, group):
+    def explode(self, group, item_pools, items, rng):
         self.kill()
-        Block.obstacles.pop((self.row, self.col))
-        item_drop_potential = random.random()
+        self.obstacles.pop((self.row, self.col))
+        item_drop_potential = rng.random()
         if item_drop_potential < 0.25:
-            item_type = random.choice(list(Items))
-            if item_type == Items.BUBBLE:
-                group.add(BubbleItem(self.asset_store, self.row, self.col, item_type))
-            elif item_type == Items.SPEED_SHOE:
-                group.add(
-                    SpeedShoeItem(self.asset_store, self.row, self.col, item_type)
+            item_type = rng.choice(list(Items))
+            group.add(
+                item_pools[item_type].acquire(
+                    self.asset_store, self.row, self.col, item_type, items
                 )
-            elif item_type == Items.NEEDLE:
-                group.add(NeedleItem(self.asset_store, self.row, self.col, item_type))
+            )
 
 
-class Bubble(pygame.sprite.Sprite):
+class Bubble(PooledSprite):
     def __init__(self, asset_store, row, col, player_id, explosion_range):
         super(Bubble, self).__init__()
+        self.reset(asset_store, row, col, player_id, explosion_range)
+
+    def reset(self, asset_store, row, col, player_id, explosion_range):
         self.asset = asset_store["spritesheets"][Assets.BUBBLE][Bubbles.DEFAULT]
         self.player_id = player_id
         self.row = row
         self.col = col
-        self.image = self.asset.get_current_frame()
+        self.animation = self.asset.start_animation()
+        self.image = self.animation.frame(0)
         self.size = self.image.get_width()
         self.rect = self.image.get_rect(
             center=(
@@ -131,12 +125,11 @@ class Bubble(pygame.sprite.Sprite):
             )
         )
         self.explosion_range = explosion_range
+        # when it was dropped, set by the grid
+        self.placed = 0
 
-    def update(self):  # type: ignore
-        self.image = self.asset.get_current_frame()
 
-
-class Explosion(pygame.sprite.Sprite):
+class Explosion(PooledSprite):
     class EXPLODE_DIR(Enum):
         CENTER = 0
         RIGHT = 1
@@ -144,23 +137,24 @@ class Explosion(pygame.sprite.Sprite):
         DOWN = 3
         UP = 4
 
-    def __init__(self, asset_store, row, col, explosion_dir, size):
+    def __init__(self, asset_store, row, col, explosion_dir, size, clock):
         super(Explosion, self).__init__()
-        self.timer = pygame.time.get_ticks()
+        self.reset(asset_store, row, col, explosion_dir, size, clock)
+
+    def reset(self, asset_store, row, col, explosion_dir, size, clock):
+        self.timer = clock.get_ticks()
         self.asset = asset_store["spritesheets"][Assets.EXPLOSION][Explosions.DEFAULT]
-        self.asset.animation.timer = self.timer
         self.explosion_dir = explosion_dir
-        # self.animation_state = AnimationComponent.mappings[Assets.EXPLOSION]["animation_type"]["explode"]
-        self.image = self.asset.get_current_frame(self)
+        self.animation = self.asset.start_animation(
+            start=self.timer,
+            rotation=self.asset.animation.explosion_rotation(explosion_dir),
+        )
+        self.image = self.animation.frame(self.timer)
         self.row = row
         self.col = col
         self.rect = self.image.get_rect()
         self.rect.topleft = (self.col * size, self.row * size)
 
-    def update(self):  # type: ignore
-        self.asset.animation.timer = self.timer
-        self.image = self.asset.get_current_frame(self)
-
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, asset_store, id, max_speed):
@@ -172,17 +166,15 @@ class Player(pygame.sprite.Sprite):
         self.id = id
         self.sprite_flip_x = 0
         self.animation_state = self.asset.get_animation_mapping("idle")
-        self.image = self.asset.get_current_frame(
-            idx=self.animation_state, flip_x=self.sprite_flip_x
-        )
+        # idling holds the first frame of the last direction moved in
+        self.move_row = self.asset.get_animation_mapping("move_down")
+        self.animation = self.asset.start_animation(self.move_row)
+        self.animation.paused = True
+        self.image = self.animation.frame(0)
         self.image_idx = 0
         self.rect = self.image.get_frect()
-        self.hitbox = pygame.Rect(
-            self.rect.x + self.image.get_width() / 7,
-            self.rect.y + self.image.get_height() * (3 / 4),
-            self.rect.width - 2 * (self.image.get_width() / 7),
-            self.image.get_height() / 4,
-        )
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
+        self.update_hitbox()
         self.is_trapped = False
 
         self.max_speed = max_speed
@@ -190,43 +182,55 @@ class Player(pygame.sprite.Sprite):
         self.num_bubbles = 1
 
         self.explosion_range = 7
-        self.animation_timer = pygame.time.get_ticks()
 
         self.inventory = []
 
     def update(self, grid, grid_size, pressed_keys):  # type: ignore
-        self.image = self.asset.get_current_frame(
-            idx=self.animation_state
-            if not self.is_trapped
-            else self.asset.get_animation_mapping("trapped"),
-            flip_x=self.sprite_flip_x,
-        )
+        self.update_animation()
         if not self.is_trapped:
             self.vel = self.max_speed
 
         self.move(grid, grid_size, pressed_keys)
 
-        self.hitbox = pygame.Rect(
-            self.rect.x + self.image.get_width() / 7,
-            self.rect.y + self.image.get_height() * (3 / 4),
-            self.rect.width - 2 * (self.image.get_width() / 7),
-            self.image.get_height() / 4,
-        )
+        self.update_hitbox()
 
     #        tile_size = self.rect.width
     #        pygame.draw.rect(
     #            self.image, pygame.Color(255, 0, 0), (0, 0, tile_size, tile_size), 1
     #        )
 
+    def update_animation(self):
+        trapped = self.asset.get_animation_mapping("trapped")
+        if self.is_trapped or self.animation_state == trapped:
+            row, paused = trapped, False
+        elif self.animation_state == self.asset.get_animation_mapping("idle"):
+            row, paused = self.move_row, True
+        else:
+            row = self.move_row = self.animation_state
+            paused = False
+        self.animation.row = row
+        self.animation.paused = paused
+        self.animation.flip_x = bool(
+            self.sprite_flip_x
+        ) and self.asset.animation.can_flip_x(row)
+
+    def update_hitbox(self):
+        self.hitbox.update(
+            self.rect.x + self.rect.width / 7,
+            self.rect.y + self.rect.height * (3 / 4),
+            self.rect.width - 2 * (self.rect.width / 7),
+            self.rect.height / 4,
+        )
+
     def use_item(self, idx):
         if 0 <= idx < len(self.inventory):
             if self.inventory[idx].activate(self):
-                self.inventory.pop(idx)
+                self.inventory.pop(idx).kill()
 
     def trap_player(self, grid):
         if not self.is_trapped:
             grid.trapped_bubble_group.add(
-                TrappedBubble(self.asset_store, self, pygame.time.get_ticks())
+                grid.trapped_bubble_pool.acquire(self.asset_store, self, grid.clock)
             )
             self.is_trapped = True
             self.sprite_flip_x = False
@@ -270,12 +274,7 @@ class Player(pygame.sprite.Sprite):
 
         self.rect.x += dx * self.vel
         self.rect.y += dy * self.vel
-        self.hitbox = pygame.Rect(
-            self.rect.x + self.rect.width / 7,
-            self.rect.y + self.rect.height * (3 / 4),
-            self.rect.width - 2 * (self.rect.width / 7),
-            self.rect.height / 4,
-        )
+        self.update_hitbox()
 
         collided_groups = self.is_collide(
             grid.obstacle_group,
@@ -313,11 +312,15 @@ class Player(pygame.sprite.Sprite):
                     elif self.rect.x + self.rect.width - entity_rect.x <= threshold:
                         self.rect.x -= 1
 
-    def is_collide(self, *groups):
-        total_overlap_area = 0
+    def is_collide(self, *groups, overlap=0):
+        # overlap is hitbox area already covered by something checked first
+        total_overlap_area = overlap
         collided_sprites = []
         for group in groups:
             player_area = self.hitbox.width * self.hitbox.height
+            if isinstance(group, TileGroup):
+                # the hitbox always lies inside rect
+                group = group.sprites_in(self.rect)
             for sprite in group:
                 rect = self.hitbox
                 sprite_rect = sprite.rect
@@ -344,7 +347,9 @@ class Player(pygame.sprite.Sprite):
                 coord = grid.get_coord(self.rect.x, self.rect.y)
                 if not grid.has_bubble(*coord):
                     grid.add_bubble(
-                        Bubble(asset_store, *coord, self.id, self.explosion_range)  # type: ignore
+                        grid.bubble_pool.acquire(
+                            asset_store, *coord, self.id, self.explosion_range
+                        )
                     )
                     grid.toggle_bubble(*coord)
                 self.num_bubbles -= 1
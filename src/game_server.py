@@ -0,0 +1,254 @@
+import argparse
+import socket
+import time
+from collections import deque
+
+import utils.config as config
+from net import protocol
+from replay import ReplayRecorder
+from simulation import Simulation
+from utils.entity_store import EntityStore
+from utils.tilemap import load_tile_map, open_map_pack
+
+
+class ClientConnection:
+    def __init__(self, player_id, addr, now):
+        self.player_id = player_id
+        self.addr = addr
+        self.last_seen = now
+        self.acked_tick = protocol.NO_BASELINE
+        self.last_queued_seq = 0
+        self.last_input_seq = 0
+        self.pending_inputs = deque()
+        self.direction = 0
+
+
+class GameServer:
+    def __init__(
+        self,
+        host,
+        port,
+        map_name=config.MAP_NAME,
+        tick_rate=config.FPS,
+        max_players=4,
+        snapshot_interval=1,
+        history_size=64,
+        max_pending_inputs=8,
+        timeout=5.0,
+        map_pack=None,
+        entity_store=False,
+        seed=None,
+        record=None,
+    ):
+        if len(map_name.encode()) > protocol.MAX_MAP_NAME:
+            raise protocol.ProtocolError(
+                f"map name {map_name} is longer than {protocol.MAX_MAP_NAME} bytes"
+            )
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.map_name = map_name
+        self.tick_rate = tick_rate
+        self.max_players = max_players
+        self.snapshot_interval = snapshot_interval
+        self.history_size = history_size
+        self.max_pending_inputs = max_pending_inputs
+        self.timeout = timeout
+        self.simulation = Simulation(
+            load_tile_map(map_name, map_pack),
+            [],
+            entity_store=EntityStore() if entity_store else None,
+            seed=seed,
+        )
+        # every input the match gets, to play it again with replay.py
+        self.recorder = (
+            ReplayRecorder(record, self.simulation, map_name) if record else None
+        )
+        self.clients = {}
+        self.history = {}
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.running = True
+
+    def free_player_id(self):
+        used = {client.player_id for client in self.clients.values()}
+        for player_id in range(256):
+            if player_id not in used and not self.simulation.grid.get_player(
+                player_id
+            ):
+                return player_id
+        return None
+
+    def receive(self, now):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                continue
+            try:
+                self.handle_packet(data, addr, now)
+            except protocol.ProtocolError:
+                # malformed or foreign packets are dropped silently
+                continue
+
+    def handle_packet(self, data, addr, now):
+        packet_type = protocol.read_header(data)
+        client = self.clients.get(addr)
+
+        if packet_type == protocol.JOIN:
+            if client is None:
+                if len(self.clients) >= self.max_players:
+                    return
+                player_id = self.free_player_id()
+                if player_id is None:
+                    return
+                client = ClientConnection(player_id, addr, now)
+                self.clients[addr] = client
+                self.simulation.add_player(player_id)
+            # resent on duplicate joins in case the first welcome was lost
+            self.send(
+                protocol.encode_welcome(
+                    client.player_id, self.tick_rate, self.map_name
+                ),
+                addr,
+            )
+        elif client is None:
+            return
+        elif packet_type == protocol.INPUT:
+            ack_tick, inputs = protocol.decode_inputs(data)
+            if ack_tick in self.history and (
+                client.acked_tick == protocol.NO_BASELINE
+                or ack_tick > client.acked_tick
+            ):
+                client.acked_tick = ack_tick
+            for record in inputs:
+                if record[0] > client.last_queued_seq:
+                    client.pending_inputs.append(record)
+                    client.last_queued_seq = record[0]
+            # a client running far ahead would otherwise build up latency
+            while len(client.pending_inputs) > self.max_pending_inputs:
+                client.pending_inputs.popleft()
+        elif packet_type == protocol.LEAVE:
+            self.drop_client(client)
+            return
+
+        client.last_seen = now
+
+    def drop_client(self, client):
+        del self.clients[client.addr]
+        self.simulation.remove_player(client.player_id)
+
+    def apply_inputs(self):
+        # one input per client per tick, the same rate the client predicts at;
+        # when none arrived in time the last direction is held
+        for client in self.clients.values():
+            if client.pending_inputs:
+                seq, direction, actions = client.pending_inputs.popleft()
+                client.last_input_seq = seq
+                client.direction = direction
+                drop_bubble, item_idx = protocol.decode_actions(actions)
+                if drop_bubble:
+                    self.simulation.drop_bubble(client.player_id)
+                if item_idx is not None:
+                    self.simulation.use_item(client.player_id, item_idx)
+            key = protocol.DIRECTION_KEYS[client.direction]
+            self.simulation.set_pressed_keys(client.player_id, [key] if key else [])
+
+    def broadcast(self):
+        tick = self.simulation.tick_count
+        snapshot = protocol.Snapshot.from_grid(
+            tick,
+            self.simulation.grid,
+            {client.player_id: client.direction for client in self.clients.values()},
+        )
+        self.history[tick] = snapshot
+        self.history.pop(tick - self.history_size * self.snapshot_interval, None)
+
+        for client in self.clients.values():
+            baseline = self.history.get(client.acked_tick)
+            self.send(
+                protocol.encode_snapshot(snapshot, baseline, client.last_input_seq),
+                client.addr,
+            )
+
+    def send(self, data, addr):
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            return
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+
+    def drop_timed_out(self, now):
+        for client in list(self.clients.values()):
+            if now - client.last_seen > self.timeout:
+                self.drop_client(client)
+
+    def tick(self):
+        now = time.perf_counter()
+        self.receive(now)
+        self.apply_inputs()
+        self.simulation.step()
+        if self.simulation.tick_count % self.snapshot_interval == 0:
+            self.broadcast()
+        self.drop_timed_out(now)
+
+    def run(self):
+        tick_duration = 1 / self.tick_rate
+        next_tick = time.perf_counter()
+        try:
+            while self.running:
+                self.tick()
+                next_tick += tick_duration
+                sleep_time = next_tick - time.perf_counter()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+                else:
+                    next_tick = time.perf_counter()
+        finally:
+            self.sock.close()
+            if self.recorder:
+                self.recorder.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Authoritative UDP game server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=12000)
+    parser.add_argument("--map", default=config.MAP_NAME)
+    parser.add_argument("--tick-rate", type=int, default=config.FPS)
+    parser.add_argument("--max-players", type=int, default=4)
+    parser.add_argument("--snapshot-interval", type=int, default=1)
+    parser.add_argument(
+        "--entity-store",
+        action="store_true",
+        help="mirror bubbles, explosions and items in columns for snapshots",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed of the match, random if not given"
+    )
+    parser.add_argument(
+        "--record", metavar="PATH", help="record the match as a replay to PATH"
+    )
+    args = parser.parse_args()
+
+    server = GameServer(
+        args.host,
+        args.port,
+        args.map,
+        args.tick_rate,
+        args.max_players,
+        args.snapshot_interval,
+        map_pack=open_map_pack(),
+        entity_store=args.entity_store,
+        seed=args.seed,
+        record=args.record,
+    )
+    print(f"listening on {server.address[0]}:{server.address[1]}", flush=True)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,59 @@
+import argparse
+import random
+
+from utils import tilemap
+from utils.types import Assets, Blocks, Obstacles
+
+# tiles kept empty around each corner so whoever spawns there can move
+SPAWN_CLEARANCE = 2
+
+
+def generate(size, seed=None, block_density=0.4, post_spacing=4):
+    # posts on a lattice with blocks scattered between them, the same map
+    # for the same seed
+    rng = random.Random(seed)
+    blocks = list(Blocks)
+    tile_map = []
+    for row in range(size):
+        tile_row = []
+        for col in range(size):
+            if row % post_spacing == 1 and col % post_spacing == 1:
+                tile_row.append((Assets.OBSTACLES, Obstacles.POST))
+            elif rng.random() < block_density:
+                tile_row.append((Assets.BLOCKS, rng.choice(blocks)))
+            else:
+                tile_row.append(None)
+        tile_map.append(tile_row)
+
+    last = size - 1
+    for corner_row, corner_col in [(0, 0), (0, last), (last, 0), (last, last)]:
+        for row in range(size):
+            for col in range(size):
+                if (
+                    abs(row - corner_row) + abs(col - corner_col) <= SPAWN_CLEARANCE
+                ):
+                    tile_map[row][col] = None
+    return tile_map
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a random square map, e.g. one larger than the "
+        "screen, and rebuild the map pack"
+    )
+    parser.add_argument("map_name")
+    parser.add_argument("--size", type=int, default=64, help="tiles per side")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--block-density",
+        type=float,
+        default=0.4,
+        help="chance of a block on each tile that is not a post",
+    )
+    args = parser.parse_args()
+
+    tilemap.save_tile_map(
+        args.map_name, generate(args.size, args.seed, args.block_density)
+    )
+    tilemap.build_map_pack()
+    print(f"wrote {args.map_name}{tilemap.MAP_EXTENSION} and rebuilt the map pack")
@@ -1,8 +1,25 @@
 import pygame
 import math
+import random
+from collections import Counter, deque
 import entities
-from utils.types import Assets
-from item import Item, BubbleItem
+from utils.types import Assets, Items
+from item import Item, BubbleItem, SpeedShoeItem, NeedleItem
+from utils.clock import Clock
+from utils.disjoint_set import DisjointSet
+from utils.pool import Pool
+from utils.tile_group import TileGroup, tile_range
+
+
+def visible(group, view):
+    return [sprite for sprite in group if view.colliderect(sprite.rect)]
+
+
+def overdue(column, now, age):
+    # whether any time in a column is at least age old. a chain is lit when
+    # its oldest bubble was placed, and an explosion group when its
+    # explosions spawned, so the oldest row is the oldest group
+    return len(column) > 0 and now - min(column) >= age
 
 
 class Tile:
@@ -15,18 +32,58 @@ class Tile:
 
 
 class Grid:
-    def __init__(self, grid_size, tile_size, asset_store, players, tile_map):
+    # (dx, dy) for each ray, in Explosion.EXPLODE_DIR order after CENTER
+    DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+    def __init__(
+        self,
+        grid_size,
+        tile_size,
+        asset_store,
+        players,
+        tile_map,
+        clock=None,
+        entity_store=None,
+        rng=None,
+    ):
         self.grid_size = grid_size
         self.tile_size = tile_size
+        # width and height of the map in pixels
+        self.world_size = grid_size * tile_size
         self.tile_map = tile_map
+        self.clock = clock if clock else Clock()
+        self.entity_store = entity_store
+        # item drops are rolled on this, so a seeded one replays the same match
+        self.rng = rng if rng else random.Random()
+        # a FrameTimer told about each phase of update(), see BnBClone.py
+        self.frame_timer = None
         self.player_group = pygame.sprite.Group()
         self.player_group.add(players)
         self.explosion_groups = []
-        self.item_group = pygame.sprite.Group()
-        self.block_group = pygame.sprite.Group()
+        self.item_group = TileGroup(self.tile_size)
+        if self.entity_store:
+            self.item_group.watchers.append(self.entity_store.items)
+        self.block_group = TileGroup(self.tile_size)
         self.bubble_groups = []
-        self.obstacle_group = pygame.sprite.Group()
+        self.bubble_sets = DisjointSet()
+        self.bubble_group_of = {}
+        self.blast_coverage = {}
+        self.blast_blockers = {}
+        self.blast_tiles = {}
+        self.obstacle_group = TileGroup(self.tile_size)
         self.trapped_bubble_group = pygame.sprite.Group()
+        self.obstacles = {}
+        self.items = {}
+        self.destroyed_blocks = set()
+        self.group_pool = Pool(lambda: TileGroup(self.tile_size))
+        self.bubble_pool = Pool(entities.Bubble)
+        self.explosion_pool = Pool(entities.Explosion)
+        self.trapped_bubble_pool = Pool(entities.TrappedBubble)
+        self.item_pools = {
+            Items.BUBBLE: Pool(BubbleItem),
+            Items.SPEED_SHOE: Pool(SpeedShoeItem),
+            Items.NEEDLE: Pool(NeedleItem),
+        }
         self.__tiles = [
             [Tile(row, col, self.tile_size) for col in range(self.grid_size)]
             for row in range(self.grid_size)
@@ -39,7 +96,12 @@ class Grid:
                     if asset_data[0] == Assets.BLOCKS:
                         self.block_group.add(
                             entities.Block(
-                                asset_store, row, col, asset_data[1], self.tile_size
+                                asset_store,
+                                row,
+                                col,
+                                asset_data[1],
+                                self.tile_size,
+                                self.obstacles,
                             )
                         )
                     elif asset_data[0] == Assets.OBSTACLES:
@@ -51,9 +113,19 @@ class Grid:
                                 asset_data[0],
                                 asset_data[1],
                                 self.tile_size,
+                                self.obstacles,
                             )
                         )
 
+        self.ray_extents = [
+            [[0] * self.grid_size for _ in range(self.grid_size)]
+            for _ in Grid.DIRECTIONS
+        ]
+        for row in range(self.grid_size):
+            self.update_row_extents(row)
+        for col in range(self.grid_size):
+            self.update_col_extents(col)
+
     def addPlayer(self, player):
         self.player_group.add(player)
 
@@ -64,51 +136,193 @@ class Grid:
         return self.__tiles[row][col].has_bubble
 
     def add_bubble(self, bubble_to_add):
-        groups_to_merge = set()
-        for bubbles, _ in self.bubble_groups:
-            for bubble in bubbles.sprites():
-                direction_to_ignore = set()
-                for i in range(bubble.explosion_range):
-                    for j in range(4):
-                        if j in direction_to_ignore:
-                            continue
-                        dx, dy = 0, 0
-                        if j == 0:
-                            dx = i + 1
-                        elif j == 1:
-                            dx = -(i + 1)
-                        elif j == 2:
-                            dy = i + 1
-                        elif j == 3:
-                            dy = -(i + 1)
-
-                        row = bubble.row + dy
-                        col = bubble.col + dx
-                        obstacle = entities.Obstacle.get_obstacle(row, col)
-                        if isinstance(obstacle, entities.Obstacle):
-                            direction_to_ignore.add(j)
-
-                        if bubble_to_add.row == row and bubble_to_add.col == col:
-                            groups_to_merge.add(bubbles)
-                            break
-
-        if len(groups_to_merge) > 0:
-            first_group = list(groups_to_merge)[0]
-            for other_group in list(groups_to_merge)[1:]:
-                if other_group in [group for group, _ in self.bubble_groups]:
-                    for sprite in other_group.sprites():
-                        first_group.add(sprite)
-                    self.bubble_groups = [
-                        grp_info
-                        for grp_info in self.bubble_groups
-                        if grp_info[0] != other_group
-                    ]
-            first_group.add(bubble_to_add)
-
+        covering_bubbles = self.blast_coverage.get(
+            (bubble_to_add.row, bubble_to_add.col), ()
+        )
+        roots = {self.bubble_sets.find(bubble) for bubble in covering_bubbles}
+        self.bubble_sets.add(bubble_to_add)
+        # a chain's fuse is its oldest bubble's, see overdue()
+        bubble_to_add.placed = self.clock.get_ticks()
+
+        if len(roots) > 0:
+            # the largest group absorbs the others and the chain keeps the
+            # oldest fuse, so merging only moves the smaller groups' sprites
+            groups_to_merge = [self.bubble_group_of.pop(root) for root in roots]
+            groups_to_merge.sort(
+                key=lambda grp_info: (
+                    -len(grp_info[0]),
+                    self.bubble_groups.index(grp_info),
+                )
+            )
+            first_group = groups_to_merge[0]
+            for other_group in groups_to_merge[1:]:
+                bubbles = other_group[0].sprites()
+                other_group[0].empty()
+                first_group[0].add(bubbles)
+                first_group[1] = min(first_group[1], other_group[1])
+                self.group_pool.release(other_group[0])
+                self.bubble_groups.remove(other_group)
+            first_group[0].add(bubble_to_add)
+            for root in roots:
+                self.bubble_sets.union(bubble_to_add, root)
         else:
-            group = pygame.sprite.Group()
+            group = self.acquire_group("bubbles")
             group.add(bubble_to_add)
-            self.bubble_groups.append([group, pygame.time.get_ticks()])
+            first_group = [group, self.clock.get_ticks()]
+            self.bubble_groups.append(first_group)
+
+        self.bubble_group_of[self.bubble_sets.find(bubble_to_add)] = first_group
+        self.index_blast(bubble_to_add)
+
+    def acquire_group(self, table_name):
+        group = self.group_pool.acquire()
+        group.watchers = (
+            [getattr(self.entity_store, table_name)] if self.entity_store else []
+        )
+        return group
+
+    def cast_blast(self, bubble):
+        tiles = []
+        blockers = []
+        for j, (dx, dy) in enumerate(Grid.DIRECTIONS):
+            extent = self.ray_extents[j][bubble.row][bubble.col]
+            for i in range(1, min(extent, bubble.explosion_range) + 1):
+                tiles.append((bubble.row + dy * i, bubble.col + dx * i))
+            if extent < bubble.explosion_range:
+                row = bubble.row + dy * (extent + 1)
+                col = bubble.col + dx * (extent + 1)
+                if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
+                    blockers.append((row, col))
+        return tiles, blockers
+
+    def index_blast(self, bubble):
+        tiles, blockers = self.cast_blast(bubble)
+        for tile in tiles:
+            self.blast_coverage.setdefault(tile, set()).add(bubble)
+        for tile in blockers:
+            self.blast_blockers.setdefault(tile, set()).add(bubble)
+        self.blast_tiles[bubble] = (tiles, blockers)
+
+    def unindex_blast(self, bubble):
+        tiles, blockers = self.blast_tiles.pop(bubble)
+        for tile in tiles:
+            covering_bubbles = self.blast_coverage[tile]
+            covering_bubbles.discard(bubble)
+            if not covering_bubbles:
+                del self.blast_coverage[tile]
+        for tile in blockers:
+            blocked_bubbles = self.blast_blockers.get(tile)
+            if blocked_bubbles is not None:
+                blocked_bubbles.discard(bubble)
+                if not blocked_bubbles:
+                    del self.blast_blockers[tile]
+
+    def remove_bubble_group(self, bubble_group):
+        bubbles = bubble_group[0].sprites()
+        if bubbles:
+            del self.bubble_group_of[self.bubble_sets.find(bubbles[0])]
+        for bubble in bubbles:
+            self.unindex_blast(bubble)
+        self.bubble_sets.discard_set(bubbles)
+
+    def is_blocked(self, row, col):
+        return isinstance(self.get_obstacle(row, col), entities.Obstacle)
+
+    def update_row_extents(self, row):
+        right = self.ray_extents[0][row]
+        left = self.ray_extents[1][row]
+        run = 0
+        for col in reversed(range(self.grid_size)):
+            right[col] = run
+            run = 0 if self.is_blocked(row, col) else run + 1
+        run = 0
+        for col in range(self.grid_size):
+            left[col] = run
+            run = 0 if self.is_blocked(row, col) else run + 1
+
+    def update_col_extents(self, col):
+        down = self.ray_extents[2]
+        up = self.ray_extents[3]
+        run = 0
+        for row in reversed(range(self.grid_size)):
+            down[row][col] = run
+            run = 0 if self.is_blocked(row, col) else run + 1
+        run = 0
+        for row in range(self.grid_size):
+            up[row][col] = run
+            run = 0 if self.is_blocked(row, col) else run + 1
+
+    def remove_obstacle(self, row, col):
+        self.update_row_extents(row)
+        self.update_col_extents(col)
+        # blasts that stopped at this tile now reach further
+        for bubble in self.blast_blockers.pop((row, col), set()):
+            self.unindex_blast(bubble)
+            self.index_blast(bubble)
+
+    def remove_block(self, row, col):
+        # a block gone without exploding, when a saved state is loaded
+        self.obstacles.pop((row, col)).kill()
+        self.destroyed_blocks.add((row, col))
+        self.remove_obstacle(row, col)
+
+    def nearest_free_tile(self, row, col):
+        visited = {(row, col)}
+        queue = deque([(row, col)])
+        while queue:
+            row, col = queue.popleft()
+            if not self.is_blocked(row, col):
+                return (row, col)
+            for dx, dy in Grid.DIRECTIONS:
+                tile = (row + dy, col + dx)
+                if (
+                    0 <= tile[0] < self.grid_size
+                    and 0 <= tile[1] < self.grid_size
+                    and tile not in visited
+                ):
+                    visited.add(tile)
+                    queue.append(tile)
+        return None
+
+    def explosion_overlap(self, player, burning):
+        # the area of the player's hitbox under explosions, each explosion on
+        # a tile counted, as is_collide adds it up over the explosion groups.
+        # an explosion's rect is its tile's
+        hitbox = player.hitbox
+        tile_size = self.tile_size
+        first_row, last_row, first_col, last_col = tile_range(
+            player.rect, tile_size
+        )
+        total = 0
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                count = burning.get((row, col))
+                if count:
+                    overlap = hitbox.clip(
+                        pygame.Rect(
+                            col * tile_size, row * tile_size, tile_size, tile_size
+                        )
+                    )
+                    total += count * overlap.width * overlap.height
+        return total
+
+    def collide_players(self):
+        # the same as going over the explosion groups for every player, with
+        # the explosions read from the columns and no explosion sprite touched
+        columns = self.entity_store.explosions.columns
+        burning = Counter(zip(columns["row"], columns["col"]))
+        for player in self.player_group.sprites():
+            overlap = self.explosion_overlap(player, burning) if burning else 0
+            if overlap / (player.hitbox.width * player.hitbox.height) > 0.66:
+                player.trap_player(self)
+            for item in player.is_collide(self.item_group, overlap=overlap):
+                player.pick_up_item(item)
+
+    def get_obstacle(self, row, col):
+        return self.obstacles.get((row, col), None)
+
+    def get_item(self, row, col):
+        return self.items.get((row, col), None)
 
     def get_player(self, id):
         for player in self.player_group:
@@ -117,60 +331,67 @@ class Grid:
         return None
 
     def drop_item(self, asset_store, row, col, item_type):
-        self.item_group.add(BubbleItem(asset_store, row, col, item_type))
+        self.item_group.add(
+            self.item_pools[Items.BUBBLE].acquire(
+                asset_store, row, col, item_type, self.items
+            )
+        )
 
     def explode_tiles(self, group_idx, asset_store):
-        group = pygame.sprite.Group()
-        for bubble in self.bubble_groups[group_idx][0]:
-            explosion = entities.Explosion(
-                asset_store,
-                bubble.row,
-                bubble.col,
-                entities.Explosion.EXPLODE_DIR.CENTER,
-                self.tile_size,
+        blast_tiles = {}
+        hit_tiles = set()
+        bubbles = self.bubble_groups[group_idx][0].sprites()
+        for bubble in bubbles:
+            blast_tiles[(bubble.row, bubble.col)] = entities.Explosion.EXPLODE_DIR.CENTER
+
+        for bubble in bubbles:
+            for j, (dx, dy) in enumerate(Grid.DIRECTIONS):
+                extent = self.ray_extents[j][bubble.row][bubble.col]
+                for i in range(1, min(extent, bubble.explosion_range) + 1):
+                    blast_tiles.setdefault(
+                        (bubble.row + dy * i, bubble.col + dx * i),
+                        entities.Explosion.EXPLODE_DIR(j + 1),
+                    )
+                if extent < bubble.explosion_range:
+                    row = bubble.row + dy * (extent + 1)
+                    col = bubble.col + dx * (extent + 1)
+                    if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
+                        hit_tiles.add((row, col))
+
+        # every ray is resolved before any block goes, so a block destroyed by
+        # one bubble still shields tiles behind it from the rest of the chain
+        for row, col in hit_tiles:
+            obstacle = self.get_obstacle(row, col)
+            if isinstance(obstacle, entities.Block):
+                obstacle.explode(
+                    self.item_group, self.item_pools, self.items, self.rng
+                )
+                self.destroyed_blocks.add((row, col))
+                self.remove_obstacle(row, col)
+
+        group = self.acquire_group("explosions")
+        for (row, col), explosion_dir in blast_tiles.items():
+            item = self.get_item(row, col)
+            if item:
+                item.kill()
+            group.add(
+                self.explosion_pool.acquire(
+                    asset_store, row, col, explosion_dir, self.tile_size, self.clock
+                )
             )
-            group.add(explosion)
-
-            direction_to_ignore = set()
-
-            for i in range(bubble.explosion_range):
-                for j in range(4):
-                    if j in direction_to_ignore:
-                        continue
-                    dx, dy = 0, 0
-                    if j == 0:
-                        dx = i + 1
-                    elif j == 1:
-                        dx = -(i + 1)
-                    elif j == 2:
-                        dy = i + 1
-                    elif j == 3:
-                        dy = -(i + 1)
-
-                    row = bubble.row + dy
-                    col = bubble.col + dx
 
-                    if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
-                        obstacle = entities.Obstacle.get_obstacle(row, col)
-
-                        if isinstance(obstacle, entities.Obstacle):
-                            if isinstance(obstacle, entities.Block):
-                                obstacle.explode(self.item_group)
-                            direction_to_ignore.add(j)
-                        else:
-                            item = Item.get_item(row, col)
-                            if item:
-                                item.kill()
-                            explosion = entities.Explosion(
-                                asset_store,
-                                row,
-                                col,
-                                entities.Explosion.EXPLODE_DIR(j + 1),
-                                self.tile_size,
-                            )
-                            group.add(explosion)
+        self.explosion_groups.append([group, self.clock.get_ticks()])
 
-        self.explosion_groups.append([group, pygame.time.get_ticks()])
+    def pool_stats(self):
+        stats = {
+            "groups": self.group_pool.stats(),
+            "bubbles": self.bubble_pool.stats(),
+            "explosions": self.explosion_pool.stats(),
+            "trapped_bubbles": self.trapped_bubble_pool.stats(),
+        }
+        for item_type, pool in self.item_pools.items():
+            stats[f"items.{item_type.value}"] = pool.stats()
+        return stats
 
     def get_tile(self, row, col):
         return self.__tiles[row][col]
@@ -181,47 +402,86 @@ class Grid:
         return (row, col)
 
     def update(self, asset_store):
-        delete_bubble_groups = []
-        delete_tile_exploded_groups = []
+        now = self.clock.get_ticks()
+        timer = self.frame_timer
 
-        for player in self.player_group.sprites():
-            for sprite in player.is_collide(
-                *[explosion_group[0] for explosion_group in self.explosion_groups],
-                self.item_group,
-                self.block_group,
-            ):
-                if isinstance(sprite, entities.Explosion):
-                    player.trap_player(self)
-                elif isinstance(sprite, Item):
-                    player.pick_up_item(sprite)
+        store = self.entity_store
+        if store:
+            self.collide_players()
+        else:
+            explosion_groups = [group for group, _ in self.explosion_groups]
+            for player in self.player_group.sprites():
+                for sprite in player.is_collide(*explosion_groups, self.item_group):
+                    if isinstance(sprite, entities.Explosion):
+                        player.trap_player(self)
+                    elif isinstance(sprite, Item):
+                        player.pick_up_item(sprite)
+        if timer:
+            timer.mark("grid.collision")
+
+        # with columns, the groups are only gone over on a tick one is due
+        if not store or overdue(store.bubbles.columns["placed"], now, 3000):
+            self.explode_bubbles(asset_store, now)
+        if timer:
+            timer.mark("grid.bubbles")
+        if not store or overdue(store.explosions.columns["spawned"], now, 500):
+            self.expire_explosions(now)
+        if timer:
+            timer.mark("grid.explosions")
+
+        self.trapped_bubble_group.update()
+        if timer:
+            timer.mark("grid.trapped")
 
+    def explode_bubbles(self, asset_store, now):
+        delete_bubble_groups = []
         for idx, bubble_group in enumerate(self.bubble_groups):
-            bubble_group[0].update()
-            if pygame.time.get_ticks() - bubble_group[1] >= 3000:
+            if now - bubble_group[1] >= 3000:
                 for bubble in bubble_group[0].sprites():
                     self.toggle_bubble(bubble.row, bubble.col)
                     player = self.get_player(bubble.player_id)
                     if player:
                         player.num_bubbles += 1
+                self.remove_bubble_group(bubble_group)
                 self.explode_tiles(idx, asset_store)
 
-                bubble_group[0].empty()
+                for bubble in bubble_group[0].sprites():
+                    bubble.kill()
+                self.group_pool.release(bubble_group[0])
                 delete_bubble_groups.append(bubble_group)
 
         for group in delete_bubble_groups:
             self.bubble_groups.remove(group)
 
+    def expire_explosions(self, now):
+        delete_tile_exploded_groups = []
         for group in self.explosion_groups:
-            if pygame.time.get_ticks() - group[1] >= 500:
-                group[0].empty()
+            if now - group[1] >= 500:
+                for explosion in group[0].sprites():
+                    explosion.kill()
+                self.group_pool.release(group[0])
                 delete_tile_exploded_groups.append(group)
-            else:
-                group[0].update()
 
         for group in delete_tile_exploded_groups:
             self.explosion_groups.remove(group)
 
+    def update_sprites(self):
+        # for network clients whose world comes from snapshots; trapped
+        # bubbles follow their player and fade out
         self.trapped_bubble_group.update()
-        self.item_group.update()
-        self.block_group.update()
-        self.obstacle_group.update()
+
+    def animated_groups(self, view=None):
+        # only what is in the world rect view, if given
+        if view is None:
+            groups = [self.item_group, self.player_group, self.trapped_bubble_group]
+            groups += [group for group, _ in self.explosion_groups]
+            groups += [group for group, _ in self.bubble_groups]
+            return groups
+        groups = [
+            self.item_group.sprites_in(view),
+            visible(self.player_group, view),
+            visible(self.trapped_bubble_group, view),
+        ]
+        groups += [group.sprites_in(view) for group, _ in self.explosion_groups]
+        groups += [group.sprites_in(view) for group, _ in self.bubble_groups]
+        return groups
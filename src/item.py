@@ -1,38 +1,39 @@
-import pygame
+from utils.pool import PooledSprite
 from utils.types import Assets
 
 
-class Item(pygame.sprite.Sprite):
-    items = {}
-
-    def __init__(self, asset_store, row, col, item_type):  # type: ignore
+class Item(PooledSprite):
+    def __init__(self, asset_store, row, col, item_type, items):  # type: ignore
         super(Item, self).__init__()
+        self.reset(asset_store, row, col, item_type, items)
+
+    def reset(self, asset_store, row, col, item_type, items):
         self.asset = asset_store["spritesheets"][Assets.ITEMS][item_type]
+        self.item_type = item_type
         self.row = row
         self.col = col
 
-        self.image = self.asset.get_current_frame()
+        self.animation = self.asset.start_animation()
+        self.image = self.animation.frame(0)
         self.rect = self.image.get_rect()
         self.size = self.rect.width
         self.rect.topleft = (self.col * self.size, self.row * self.size)
 
-        Item.items[(self.row, self.col)] = self
+        self.items = items
+        self.items[(self.row, self.col)] = self
 
-    def update(self):  # type: ignore
-        self.image = self.asset.get_current_frame()
+    def kill(self):
+        if self.items.get((self.row, self.col)) is self:
+            self.items.pop((self.row, self.col))
+        super(Item, self).kill()
 
     def acquire(self, player):
         self.kill()
-        Item.items.pop((self.row, self.col))
-
-    @classmethod
-    def get_item(cls, row, col):
-        return cls.items.get((row, col), None)
 
 
 class BubbleItem(Item):
-    def __init__(self, asset_store, row, col, item_type):
-        super(BubbleItem, self).__init__(asset_store, row, col, item_type)
+    def __init__(self, asset_store, row, col, item_type, items):
+        super(BubbleItem, self).__init__(asset_store, row, col, item_type, items)
 
     def acquire(self, player):
         super().acquire(player)
@@ -40,8 +41,8 @@ class BubbleItem(Item):
 
 
 class SpeedShoeItem(Item):
-    def __init__(self, asset_store, row, col, item_type):
-        super(SpeedShoeItem, self).__init__(asset_store, row, col, item_type)
+    def __init__(self, asset_store, row, col, item_type, items):
+        super(SpeedShoeItem, self).__init__(asset_store, row, col, item_type, items)
 
     def acquire(self, player):
         super().acquire(player)
@@ -49,13 +50,17 @@ class SpeedShoeItem(Item):
 
 
 class NeedleItem(Item):
-    def __init__(self, asset_store, row, col, item_type):
-        super(NeedleItem, self).__init__(asset_store, row, col, item_type)
+    def __init__(self, asset_store, row, col, item_type, items):
+        super(NeedleItem, self).__init__(asset_store, row, col, item_type, items)
 
     def acquire(self, player):
+        # stays referenced from the inventory, so it only goes back to the
+        # pool once it is used up or pushed out, when it is killed again
+        pool, self.pool = self.pool, None
         super().acquire(player)
+        self.pool = pool
         if len(player.inventory) > 4:
-            player.inventory.pop()
+            player.inventory.pop().kill()
         player.inventory.insert(0, self)
 
     def activate(self, player):
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# stdout is only the json results, so they can be piped into other tools
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import utils.config as config
+from net import protocol
+from utils.stats import percentile
+
+
+def process_cpu_seconds(pid):
+    # utime + stime from /proc/<pid>/stat, in clock ticks
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class ScriptedClient(asyncio.DatagramProtocol):
+    def __init__(self, client_id, server_address, rng, loss, history_size=64):
+        self.client_id = client_id
+        self.server_address = server_address
+        self.rng = rng
+        self.loss = loss
+        self.history_size = history_size
+        self.transport = None
+        self.player_id = None
+        self.snapshots = {}
+        self.latest_tick = protocol.NO_BASELINE
+        self.input_seq = 0
+        self.inputs = []
+        self.sent_at = {}
+        self.direction = 0
+        self.ticks_to_turn = 0
+        self.latencies = []
+        self.snapshots_received = 0
+        self.snapshots_dropped = 0
+        self.snapshots_undecodable = 0
+        self.inputs_dropped = 0
+        self.ticks_missed = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.rng.random() < self.loss:
+            self.snapshots_dropped += 1
+            return
+        try:
+            packet_type = protocol.read_header(data)
+            if packet_type == protocol.WELCOME:
+                self.player_id = protocol.decode_welcome(data)[0]
+                return
+            if packet_type != protocol.SNAPSHOT:
+                return
+            decoded = protocol.decode_snapshot(data, self.snapshots)
+        except protocol.ProtocolError:
+            return
+        if decoded is None:
+            # the baseline it was encoded against is gone, the next snapshot
+            # is re-encoded against whatever we ack instead
+            self.snapshots_undecodable += 1
+            return
+
+        snapshot, ack_input_seq = decoded
+        self.snapshots_received += 1
+        self.snapshots[snapshot.tick] = snapshot
+        self.snapshots.pop(snapshot.tick - self.history_size, None)
+        if self.latest_tick == protocol.NO_BASELINE or snapshot.tick > self.latest_tick:
+            if self.latest_tick != protocol.NO_BASELINE:
+                self.ticks_missed += snapshot.tick - self.latest_tick - 1
+            self.latest_tick = snapshot.tick
+
+        now = time.perf_counter()
+        for seq in [seq for seq in self.sent_at if seq <= ack_input_seq]:
+            if seq == ack_input_seq:
+                self.latencies.append(now - self.sent_at[seq])
+            del self.sent_at[seq]
+
+    def join(self):
+        self.transport.sendto(protocol.encode_join(), self.server_address)
+
+    def tick(self):
+        if self.player_id is None:
+            self.join()
+            return
+
+        if self.ticks_to_turn <= 0:
+            self.direction = self.rng.randrange(len(protocol.DIRECTION_KEYS))
+            self.ticks_to_turn = self.rng.randint(20, 90)
+        self.ticks_to_turn -= 1
+        drop_bubble = self.rng.random() < 0.01
+        item_idx = 0 if self.rng.random() < 0.002 else None
+
+        self.input_seq += 1
+        self.inputs.append(
+            (
+                self.input_seq,
+                self.direction,
+                protocol.encode_actions(drop_bubble, item_idx),
+            )
+        )
+        del self.inputs[: -protocol.MAX_INPUTS_PER_PACKET]
+        self.sent_at[self.input_seq] = time.perf_counter()
+
+        if self.rng.random() < self.loss:
+            self.inputs_dropped += 1
+            return
+        ack_tick = self.latest_tick if self.latest_tick != protocol.NO_BASELINE else 0
+        self.transport.sendto(
+            protocol.encode_inputs(ack_tick, self.inputs), self.server_address
+        )
+
+    def leave(self):
+        self.transport.sendto(protocol.encode_leave(), self.server_address)
+        self.transport.close()
+
+
+def start_room_server(port, map_name, tick_rate, players_per_room):
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_server.py"),
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--map",
+            map_name,
+            "--tick-rate",
+            str(tick_rate),
+            "--max-players",
+            str(players_per_room),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    # game_server.py prints its address once the socket is bound
+    while "listening" not in server.stdout.readline():
+        if server.poll() is not None:
+            raise RuntimeError(f"room server on port {port} exited")
+    return server
+
+
+async def run_load_test(
+    num_clients, players_per_room, base_port, map_name, tick_rate, duration, loss, seed
+):
+    num_rooms = -(-num_clients // players_per_room)
+    servers = [
+        start_room_server(base_port + room, map_name, tick_rate, players_per_room)
+        for room in range(num_rooms)
+    ]
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    clients = []
+    try:
+        for client_id in range(num_clients):
+            address = ("127.0.0.1", base_port + client_id // players_per_room)
+            _, client = await loop.create_datagram_endpoint(
+                lambda: ScriptedClient(
+                    client_id, address, random.Random(rng.random()), loss
+                ),
+                remote_addr=address,
+            )
+            clients.append(client)
+
+        cpu_start = [process_cpu_seconds(server.pid) for server in servers]
+        start = next_tick = time.perf_counter()
+        tick_duration = 1 / tick_rate
+        client_ticks = 0
+        late_ticks = 0
+        while time.perf_counter() - start < duration:
+            for client in clients:
+                client.tick()
+            client_ticks += 1
+            next_tick += tick_duration
+            sleep_time = next_tick - time.perf_counter()
+            if sleep_time < 0:
+                # the harness itself can't keep up; results past here
+                # understate what the server can do
+                late_ticks += 1
+                next_tick = time.perf_counter()
+                sleep_time = 0
+            await asyncio.sleep(sleep_time)
+        elapsed = time.perf_counter() - start
+        cpu_end = [process_cpu_seconds(server.pid) for server in servers]
+    finally:
+        for client in clients:
+            client.leave()
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(
+        latency for client in clients for latency in client.latencies
+    )
+    cpu_per_room = sorted(
+        (end - begin) / elapsed for begin, end in zip(cpu_start, cpu_end)
+    )
+    expected_snapshots = sum(
+        1 for client in clients if client.player_id is not None
+    ) * int(elapsed * tick_rate)
+    received = sum(client.snapshots_received for client in clients)
+
+    def ms(value):
+        return None if value is None else value * 1000
+
+    return {
+        "clients": num_clients,
+        "rooms": num_rooms,
+        "tick_rate": tick_rate,
+        "duration": elapsed,
+        "simulated_loss": loss,
+        "clients_joined": sum(1 for client in clients if client.player_id is not None),
+        "harness_late_ticks": late_ticks,
+        "harness_ticks": client_ticks,
+        "input_ack_latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "snapshots": {
+            "expected": expected_snapshots,
+            "received": received,
+            "dropped_by_harness": sum(c.snapshots_dropped for c in clients),
+            "undecodable": sum(c.snapshots_undecodable for c in clients),
+            "ticks_missed": sum(c.ticks_missed for c in clients),
+        },
+        "inputs_dropped_by_harness": sum(c.inputs_dropped for c in clients),
+        "server_cpu_per_room": {
+            "mean": sum(cpu_per_room) / len(cpu_per_room),
+            "p50": percentile(cpu_per_room, 0.50),
+            "max": cpu_per_room[-1],
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run scripted clients against local game_server.py rooms"
+    )
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--players-per-room", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=13000)
+    parser.add_argument("--map", default=config.MAP_NAME)
+    parser.add_argument("--tick-rate", type=int, default=config.FPS)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument(
+        "--loss", type=float, default=0.0, help="fraction of packets to drop, each way"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        run_load_test(
+            args.clients,
+            args.players_per_room,
+            args.base_port,
+            args.map,
+            args.tick_rate,
+            args.duration,
+            args.loss,
+            args.seed,
+        )
+    )
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
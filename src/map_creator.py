@@ -1,7 +1,7 @@
 import pygame
-import os
-import pickle
 from utils.assets import AssetStore, Asset
+from utils.sprite_cache import SpriteCache
+from utils import tilemap
 import utils.config as config
 
 
@@ -141,7 +141,9 @@ class MapCreator:
         self.mode = mode
         self.map_name = map_name
         self.sprite_size = config.GRID_SIZE / config.NUM_TILES
-        self.asset_store = AssetStore(self.sprite_size, config.GRID_SIZE)
+        self.asset_store = AssetStore(
+            self.sprite_size, config.GRID_SIZE, cache=SpriteCache()
+        )
 
         if mode == 1:
             tile_map = self.fetch_tile_map()
@@ -163,12 +165,7 @@ class MapCreator:
         self.last_edited_canvas_image = None
 
     def fetch_tile_map(self):
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        path = os.path.join(curr_dir, "../tilemaps/", self.map_name)
-        file = open(path, "rb")
-        tile_map = pickle.load(file)
-
-        return tile_map if tile_map else None
+        return tilemap.load_tile_map(self.map_name)
 
     def handle_click(self, coord):
         for image in self.canvas.image_group:
@@ -231,10 +228,8 @@ class MapCreator:
         self.terminate()
 
     def terminate(self):
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        path = os.path.join(curr_dir, "../tilemaps/", self.map_name)
-        file = open(path, "w+b")
-        pickle.dump(self.canvas.tile_map, file)
+        tilemap.save_tile_map(self.map_name, self.canvas.tile_map)
+        tilemap.build_map_pack()
         pygame.quit()
 
 
@@ -0,0 +1,285 @@
+import math
+import select
+import socket
+import time
+from collections import deque
+
+import entities
+from net import protocol
+from utils.types import Items
+
+# animation and sprite flip for each direction index in DIRECTION_KEYS
+FACING_ANIMATIONS = {
+    1: ("move_up", 0),
+    2: ("move_down", 0),
+    3: ("move_side", 0),
+    4: ("move_side", 1),
+}
+
+
+class NetClient:
+    def __init__(
+        self,
+        server_address,
+        asset_store,
+        smoothing=0.85,
+        history_size=64,
+        max_pending_inputs=256,
+    ):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.server_address = server_address
+        self.asset_store = asset_store
+        self.smoothing = smoothing
+        self.history_size = history_size
+        self.max_pending_inputs = max_pending_inputs
+        self.player_id = None
+        self.tick_rate = None
+        self.map_name = None
+        self.snapshots = {}
+        self.latest_tick = protocol.NO_BASELINE
+        self.input_seq = 0
+        self.pending_inputs = deque()
+        self.pending_actions = 0
+        self.correction = [0.0, 0.0]
+        self.remote_facing = {}
+        self.explosion_group = None
+
+    def connect(self, timeout=5.0, retry_interval=0.25):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            self.sock.sendto(protocol.encode_join(), self.server_address)
+            readable, _, _ = select.select([self.sock], [], [], retry_interval)
+            if not readable:
+                continue
+            data, _ = self.sock.recvfrom(2048)
+            try:
+                if protocol.read_header(data) == protocol.WELCOME:
+                    self.player_id, self.tick_rate, self.map_name = (
+                        protocol.decode_welcome(data)
+                    )
+                    return self.player_id, self.map_name
+            except protocol.ProtocolError:
+                continue
+        raise ConnectionError(f"no answer from server {self.server_address}")
+
+    def disconnect(self):
+        self.sock.sendto(protocol.encode_leave(), self.server_address)
+        self.sock.close()
+
+    def queue_drop_bubble(self):
+        self.pending_actions |= protocol.ACTION_DROP_BUBBLE
+
+    def queue_use_item(self, idx):
+        self.pending_actions &= ~protocol.ACTION_ITEM_MASK
+        self.pending_actions |= protocol.encode_actions(item_idx=idx)
+
+    def receive(self):
+        newest = None
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError, ConnectionResetError):
+                break
+            try:
+                if protocol.read_header(data) != protocol.SNAPSHOT:
+                    continue
+                decoded = protocol.decode_snapshot(data, self.snapshots)
+            except protocol.ProtocolError:
+                continue
+            if decoded is None:
+                continue
+            snapshot, ack_input_seq = decoded
+            self.snapshots[snapshot.tick] = snapshot
+            self.snapshots.pop(snapshot.tick - self.history_size, None)
+            # packets can arrive out of order, only the newest state matters
+            if newest is None or snapshot.tick > newest[0].tick:
+                newest = decoded
+        if newest and (
+            self.latest_tick == protocol.NO_BASELINE
+            or newest[0].tick > self.latest_tick
+        ):
+            self.latest_tick = newest[0].tick
+            return newest
+        return None
+
+    def update(self, grid, pressed_keys):
+        received = self.receive()
+        if received:
+            self.apply_snapshot(grid, *received)
+
+        self.input_seq += 1
+        record = (self.input_seq, protocol.direction_of(pressed_keys), self.pending_actions)
+        self.pending_actions = 0
+        self.pending_inputs.append(record)
+        while len(self.pending_inputs) > self.max_pending_inputs:
+            self.pending_inputs.popleft()
+
+        # movement is applied locally straight away; bubbles and items wait
+        # for the server so they never have to be rolled back
+        player = grid.get_player(self.player_id)
+        if player:
+            self.predict(grid, player, record[1])
+
+        ack_tick = self.latest_tick if self.latest_tick != protocol.NO_BASELINE else 0
+        self.sock.sendto(
+            protocol.encode_inputs(ack_tick, list(self.pending_inputs)),
+            self.server_address,
+        )
+
+        for player in grid.player_group.sprites():
+            if player.id != self.player_id:
+                player.update(grid, grid.world_size, [])
+                animation = FACING_ANIMATIONS.get(self.remote_facing.get(player.id))
+                if animation and not player.is_trapped:
+                    player.animation_state = player.asset.get_animation_mapping(
+                        animation[0]
+                    )
+                    player.sprite_flip_x = animation[1]
+                    player.update_animation()
+
+        self.correction[0] *= self.smoothing
+        self.correction[1] *= self.smoothing
+
+    def predict(self, grid, player, direction):
+        # the exact movement and collision code the server runs
+        key = protocol.DIRECTION_KEYS[direction]
+        player.update(grid, grid.world_size, [key] if key else [])
+
+    def draw_position(self, player):
+        if player.id == self.player_id:
+            return (
+                player.rect.x + self.correction[0],
+                player.rect.y + self.correction[1],
+            )
+        return player.rect.topleft
+
+    def apply_snapshot(self, grid, snapshot, ack_input_seq):
+        self.apply_world(grid, snapshot)
+
+        for player in grid.player_group.sprites():
+            if player.id not in snapshot.players:
+                # lets the trapped bubble expire along with the player
+                player.is_trapped = False
+                player.kill()
+
+        for player_id, record in snapshot.players.items():
+            player = grid.get_player(player_id)
+            if player is None:
+                player = entities.Player(self.asset_store, player_id, 3)
+                grid.addPlayer(player)
+            if player_id == self.player_id:
+                self.reconcile(grid, player, record, ack_input_seq)
+            else:
+                self.apply_player_record(grid, player, record)
+                self.remote_facing[player_id] = (
+                    record[3] >> protocol.PLAYER_FACING_SHIFT
+                )
+
+    def apply_player_record(self, grid, player, record):
+        _, x, y, flags, speed, num_bubbles, explosion_range = record
+        player.rect.x = x / protocol.POSITION_SCALE
+        player.rect.y = y / protocol.POSITION_SCALE
+        player.max_speed = speed / protocol.SPEED_SCALE
+        player.num_bubbles = num_bubbles
+        player.explosion_range = explosion_range
+        if flags & protocol.PLAYER_TRAPPED:
+            player.trap_player(grid)
+        elif player.is_trapped:
+            player.is_trapped = False
+        player.update_hitbox()
+
+    def reconcile(self, grid, player, record, ack_input_seq):
+        # rewind to the authoritative state, replay whatever the server has
+        # not processed yet and hide the difference behind a decaying offset
+        predicted = (player.rect.x, player.rect.y)
+        self.apply_player_record(grid, player, record)
+        while self.pending_inputs and self.pending_inputs[0][0] <= ack_input_seq:
+            self.pending_inputs.popleft()
+        for _, direction, _ in self.pending_inputs:
+            self.predict(grid, player, direction)
+
+        self.correction[0] += predicted[0] - player.rect.x
+        self.correction[1] += predicted[1] - player.rect.y
+        if math.hypot(*self.correction) > grid.tile_size:
+            # too far off to smooth, snap instead
+            self.correction = [0.0, 0.0]
+
+    def apply_world(self, grid, snapshot):
+        for row, col in snapshot.destroyed_blocks - grid.destroyed_blocks:
+            block = grid.get_obstacle(row, col)
+            if isinstance(block, entities.Block):
+                block.kill()
+                grid.obstacles.pop((row, col))
+                grid.remove_obstacle(row, col)
+            grid.destroyed_blocks.add((row, col))
+
+        self.apply_bubbles(grid, snapshot)
+        self.apply_explosions(grid, snapshot)
+
+        item_types = list(Items)
+        for tile, item in list(grid.items.items()):
+            if snapshot.items.get(tile) != item_types.index(item.item_type):
+                item.kill()
+        for (row, col), item_type_idx in snapshot.items.items():
+            if (row, col) not in grid.items and item_type_idx < len(item_types):
+                item_type = item_types[item_type_idx]
+                grid.item_group.add(
+                    grid.item_pools[item_type].acquire(
+                        self.asset_store, row, col, item_type, grid.items
+                    )
+                )
+
+    def apply_bubbles(self, grid, snapshot):
+        present = set()
+        for bubble_group in list(grid.bubble_groups):
+            bubbles = bubble_group[0].sprites()
+            if all((bubble.row, bubble.col) in snapshot.bubbles for bubble in bubbles):
+                present.update((bubble.row, bubble.col) for bubble in bubbles)
+                continue
+            # a chain went off on the server; anything in it that is still
+            # alive is added back below
+            grid.remove_bubble_group(bubble_group)
+            for bubble in bubbles:
+                grid.toggle_bubble(bubble.row, bubble.col)
+                bubble.kill()
+            grid.group_pool.release(bubble_group[0])
+            grid.bubble_groups.remove(bubble_group)
+
+        for (row, col), owner_id in snapshot.bubbles.items():
+            if (row, col) in present:
+                continue
+            owner = snapshot.players.get(owner_id)
+            grid.add_bubble(
+                grid.bubble_pool.acquire(
+                    self.asset_store, row, col, owner_id, owner[6] if owner else 1
+                )
+            )
+            grid.toggle_bubble(row, col)
+
+    def apply_explosions(self, grid, snapshot):
+        if self.explosion_group is None:
+            self.explosion_group = [grid.acquire_group("explosions"), 0]
+            grid.explosion_groups.append(self.explosion_group)
+        group = self.explosion_group[0]
+
+        for explosion in group.sprites():
+            if (
+                snapshot.explosions.get((explosion.row, explosion.col))
+                != explosion.explosion_dir.value
+            ):
+                explosion.kill()
+        for (row, col), explosion_dir in snapshot.explosions.items():
+            if explosion_dir >= len(entities.Explosion.EXPLODE_DIR):
+                continue
+            if not group.sprites_at(row, col):
+                group.add(
+                    grid.explosion_pool.acquire(
+                        self.asset_store,
+                        row,
+                        col,
+                        entities.Explosion.EXPLODE_DIR(explosion_dir),
+                        grid.tile_size,
+                        grid.clock,
+                    )
+                )
@@ -0,0 +1,303 @@
+import struct
+
+import pygame
+
+from utils.types import Items
+
+# every packet starts with HEADER; all integers are little-endian and every
+# record has a fixed size, so a packet is validated by its length alone
+MAGIC = 0xB0B1
+VERSION = 2
+
+JOIN = 0
+WELCOME = 1
+INPUT = 2
+SNAPSHOT = 3
+LEAVE = 4
+
+HEADER = struct.Struct("<HBB")
+WELCOME_BODY = struct.Struct("<BH16s")
+# the map name field of WELCOME_BODY, in utf-8 bytes
+MAX_MAP_NAME = 16
+INPUT_BODY = struct.Struct("<IB")
+INPUT_RECORD = struct.Struct("<IBB")
+SNAPSHOT_BODY = struct.Struct("<III")
+COUNT = struct.Struct("<H")
+PLAYER_ID = struct.Struct("<B")
+# positions are 32 bit so maps can be larger than 4096 pixels
+PLAYER_RECORD = struct.Struct("<BIIBBBB")
+TILE = struct.Struct("<BB")
+TILE_RECORD = struct.Struct("<BBB")
+
+NO_BASELINE = 0xFFFFFFFF
+POSITION_SCALE = 16
+SPEED_SCALE = 10
+MAX_INPUTS_PER_PACKET = 8
+
+# direction byte sent in inputs, index into this tuple
+DIRECTION_KEYS = (None, pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT)
+
+ACTION_DROP_BUBBLE = 0x01
+# bits 1-3 hold the inventory slot to use, plus one
+ACTION_ITEM_SHIFT = 1
+ACTION_ITEM_MASK = 0x0E
+
+PLAYER_TRAPPED = 0x01
+# bits 1-3 hold the index of the last direction key in DIRECTION_KEYS
+PLAYER_FACING_SHIFT = 1
+
+TILE_SECTIONS = ("bubbles", "explosions", "items")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def pack_header(packet_type):
+    return HEADER.pack(MAGIC, VERSION, packet_type)
+
+
+def read_header(data):
+    if len(data) < HEADER.size:
+        raise ProtocolError("packet too short")
+    magic, version, packet_type = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError("unknown protocol")
+    return packet_type
+
+
+def encode_join():
+    return pack_header(JOIN)
+
+
+def encode_leave():
+    return pack_header(LEAVE)
+
+
+def encode_welcome(player_id, tick_rate, map_name):
+    # struct would cut a longer name short and the client would load
+    # whatever map the rest of it names
+    encoded_name = map_name.encode()
+    if len(encoded_name) > MAX_MAP_NAME:
+        raise ProtocolError(f"map name {map_name} is too long to send")
+    return pack_header(WELCOME) + WELCOME_BODY.pack(
+        player_id, tick_rate, encoded_name
+    )
+
+
+def decode_welcome(data):
+    if len(data) != HEADER.size + WELCOME_BODY.size:
+        raise ProtocolError("bad welcome")
+    player_id, tick_rate, map_name = WELCOME_BODY.unpack_from(data, HEADER.size)
+    return player_id, tick_rate, map_name.rstrip(b"\0").decode()
+
+
+def direction_of(pressed_keys):
+    if pressed_keys and pressed_keys[-1] in DIRECTION_KEYS:
+        return DIRECTION_KEYS.index(pressed_keys[-1])
+    return 0
+
+
+def encode_actions(drop_bubble=False, item_idx=None):
+    actions = ACTION_DROP_BUBBLE if drop_bubble else 0
+    if item_idx is not None:
+        actions |= (item_idx + 1) << ACTION_ITEM_SHIFT
+    return actions
+
+
+def decode_actions(actions):
+    item_slot = (actions & ACTION_ITEM_MASK) >> ACTION_ITEM_SHIFT
+    return bool(actions & ACTION_DROP_BUBBLE), item_slot - 1 if item_slot else None
+
+
+def encode_inputs(ack_tick, inputs):
+    # inputs are (sequence, direction, actions) tuples, oldest first; the most
+    # recent few are resent every packet so a single lost packet loses nothing
+    inputs = inputs[-MAX_INPUTS_PER_PACKET:]
+    parts = [pack_header(INPUT), INPUT_BODY.pack(ack_tick, len(inputs))]
+    parts += [INPUT_RECORD.pack(*record) for record in inputs]
+    return b"".join(parts)
+
+
+def decode_inputs(data):
+    offset = HEADER.size
+    if len(data) < offset + INPUT_BODY.size:
+        raise ProtocolError("bad input")
+    ack_tick, count = INPUT_BODY.unpack_from(data, offset)
+    offset += INPUT_BODY.size
+    if count > MAX_INPUTS_PER_PACKET or len(data) != offset + count * INPUT_RECORD.size:
+        raise ProtocolError("bad input")
+    inputs = [
+        INPUT_RECORD.unpack_from(data, offset + i * INPUT_RECORD.size)
+        for i in range(count)
+    ]
+    for _, direction, _ in inputs:
+        if direction >= len(DIRECTION_KEYS):
+            raise ProtocolError("bad direction")
+    return ack_tick, inputs
+
+
+class Snapshot:
+    def __init__(
+        self,
+        tick,
+        players=None,
+        bubbles=None,
+        explosions=None,
+        items=None,
+        destroyed_blocks=None,
+    ):
+        self.tick = tick
+        # player id -> PLAYER_RECORD tuple
+        self.players = players if players is not None else {}
+        # (row, col) -> owner id / explosion direction / item type index
+        self.bubbles = bubbles if bubbles is not None else {}
+        self.explosions = explosions if explosions is not None else {}
+        self.items = items if items is not None else {}
+        self.destroyed_blocks = (
+            destroyed_blocks if destroyed_blocks is not None else frozenset()
+        )
+
+    @classmethod
+    def from_grid(cls, tick, grid, facing):
+        item_types = list(Items)
+        snapshot = cls(tick, destroyed_blocks=frozenset(grid.destroyed_blocks))
+        for player in grid.player_group.sprites():
+            flags = PLAYER_TRAPPED if player.is_trapped else 0
+            flags |= facing.get(player.id, 0) << PLAYER_FACING_SHIFT
+            snapshot.players[player.id] = (
+                player.id,
+                round(player.rect.x * POSITION_SCALE),
+                round(player.rect.y * POSITION_SCALE),
+                flags,
+                min(255, round(player.max_speed * SPEED_SCALE)),
+                min(255, player.num_bubbles),
+                min(255, player.explosion_range),
+            )
+        if grid.entity_store:
+            # straight from the columns, no sprite is looked at
+            store = grid.entity_store
+            snapshot.bubbles = store.bubbles.by_tile("owner")
+            snapshot.explosions = store.explosions.by_tile("direction")
+            snapshot.items = store.items.by_tile("item_type")
+            return snapshot
+        for bubble_group, _ in grid.bubble_groups:
+            for bubble in bubble_group:
+                snapshot.bubbles[(bubble.row, bubble.col)] = bubble.player_id
+        for explosion_group, _ in grid.explosion_groups:
+            for explosion in explosion_group:
+                snapshot.explosions[(explosion.row, explosion.col)] = (
+                    explosion.explosion_dir.value
+                )
+        for item in grid.item_group:
+            snapshot.items[(item.row, item.col)] = item_types.index(item.item_type)
+        return snapshot
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Snapshot)
+            and self.players == other.players
+            and self.bubbles == other.bubbles
+            and self.explosions == other.explosions
+            and self.items == other.items
+            and self.destroyed_blocks == other.destroyed_blocks
+        )
+
+
+EMPTY_SNAPSHOT = Snapshot(NO_BASELINE)
+
+
+def encode_snapshot(snapshot, baseline, ack_input_seq):
+    # only what changed since the baseline the client acknowledged is sent; a
+    # full snapshot is just a delta against EMPTY_SNAPSHOT
+    if baseline is None:
+        baseline = EMPTY_SNAPSHOT
+    parts = [
+        pack_header(SNAPSHOT),
+        SNAPSHOT_BODY.pack(snapshot.tick, baseline.tick, ack_input_seq),
+    ]
+
+    changed = [
+        record
+        for player_id, record in snapshot.players.items()
+        if baseline.players.get(player_id) != record
+    ]
+    removed = [
+        player_id for player_id in baseline.players if player_id not in snapshot.players
+    ]
+    parts.append(COUNT.pack(len(changed)))
+    parts += [PLAYER_RECORD.pack(*record) for record in changed]
+    parts.append(COUNT.pack(len(removed)))
+    parts += [PLAYER_ID.pack(player_id) for player_id in removed]
+
+    for section in TILE_SECTIONS:
+        current = getattr(snapshot, section)
+        previous = getattr(baseline, section)
+        changed = [
+            (tile, value)
+            for tile, value in current.items()
+            if previous.get(tile) != value
+        ]
+        removed = [tile for tile in previous if tile not in current]
+        parts.append(COUNT.pack(len(changed)))
+        parts += [TILE_RECORD.pack(*tile, value) for tile, value in changed]
+        parts.append(COUNT.pack(len(removed)))
+        parts += [TILE.pack(*tile) for tile in removed]
+
+    # blocks never come back, so only newly destroyed ones are sent
+    destroyed = snapshot.destroyed_blocks - baseline.destroyed_blocks
+    parts.append(COUNT.pack(len(destroyed)))
+    parts += [TILE.pack(*tile) for tile in sorted(destroyed)]
+    return b"".join(parts)
+
+
+def decode_snapshot(data, baselines):
+    # returns (snapshot, ack_input_seq), or None when the baseline it was
+    # encoded against is no longer in baselines
+    offset = HEADER.size
+    try:
+        tick, baseline_tick, ack_input_seq = SNAPSHOT_BODY.unpack_from(data, offset)
+        offset += SNAPSHOT_BODY.size
+        if baseline_tick == NO_BASELINE:
+            baseline = EMPTY_SNAPSHOT
+        elif baseline_tick in baselines:
+            baseline = baselines[baseline_tick]
+        else:
+            return None
+
+        def read_records(record_struct):
+            nonlocal offset
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            records = [
+                record_struct.unpack_from(data, offset + i * record_struct.size)
+                for i in range(count)
+            ]
+            offset += count * record_struct.size
+            return records
+
+        players = dict(baseline.players)
+        for record in read_records(PLAYER_RECORD):
+            players[record[0]] = record
+        for (player_id,) in read_records(PLAYER_ID):
+            players.pop(player_id, None)
+
+        sections = {}
+        for section in TILE_SECTIONS:
+            tiles = dict(getattr(baseline, section))
+            for row, col, value in read_records(TILE_RECORD):
+                tiles[(row, col)] = value
+            for tile in read_records(TILE):
+                tiles.pop(tile, None)
+            sections[section] = tiles
+
+        destroyed_blocks = baseline.destroyed_blocks | frozenset(read_records(TILE))
+    except struct.error:
+        raise ProtocolError("truncated snapshot")
+    if offset != len(data):
+        raise ProtocolError("trailing bytes in snapshot")
+
+    return (
+        Snapshot(tick, players, destroyed_blocks=destroyed_blocks, **sections),
+        ack_input_seq,
+    )
@@ -0,0 +1,337 @@
+import argparse
+import bisect
+import json
+import random
+import struct
+import sys
+import time
+import zlib
+
+import utils.config as config
+from bots import RandomBot
+from net import protocol
+from simulation import Simulation
+from utils.tilemap import decode_tile_map, encode_tile_map, load_tile_map, open_map_pack
+
+# a replay is HEADER and a json blob of match info, then records of RECORD
+# followed by its payload: the tile map, a keyframe of the whole simulation
+# every keyframe_interval ticks and the inputs of every tick that had any.
+# records are only ever appended, so a replay cut short is still readable
+MAGIC = b"BNBR"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")
+RECORD = struct.Struct("<BII")
+EVENT = struct.Struct("<BBB")
+
+TILE_MAP = 0
+KEYFRAME = 1
+INPUTS = 2
+END = 3
+
+# what an input event does, its value is the direction index of
+# protocol.DIRECTION_KEYS, the inventory slot or the joining player's speed
+JOIN = 0
+LEAVE = 1
+DIRECTION = 2
+DROP_BUBBLE = 3
+USE_ITEM = 4
+
+
+class ReplayError(Exception):
+    pass
+
+
+class ReplayRecorder:
+    # writes everything a simulation is told and a keyframe of it every
+    # keyframe_interval ticks. set as simulation.recorder, from the tick the
+    # simulation is at
+    def __init__(self, path, simulation, map_name, keyframe_interval=1000):
+        self.file = open(path, "wb")
+        self.keyframe_interval = keyframe_interval
+        self.events = []
+        self.directions = {
+            player_id: protocol.direction_of(keys)
+            for player_id, keys in simulation.pressed_keys.items()
+        }
+        meta = json.dumps(
+            {
+                "map_name": map_name,
+                "seed": simulation.seed,
+                "tick_rate": simulation.clock.tick_rate,
+                "keyframe_interval": keyframe_interval,
+                "start_tick": simulation.tick_count,
+            }
+        ).encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(meta)) + meta)
+        self.write(
+            TILE_MAP,
+            simulation.tick_count,
+            zlib.compress(encode_tile_map(simulation.tile_map)),
+        )
+        self.write_keyframe(simulation)
+        simulation.recorder = self
+        self.simulation = simulation
+
+    def write(self, kind, tick, payload=b""):
+        self.file.write(RECORD.pack(kind, tick, len(payload)) + payload)
+
+    def write_keyframe(self, simulation):
+        self.write(
+            KEYFRAME,
+            simulation.tick_count,
+            zlib.compress(json.dumps(simulation.state()).encode()),
+        )
+
+    def add_player(self, player_id, max_speed):
+        self.events.append(
+            (JOIN, player_id, min(255, round(max_speed * protocol.SPEED_SCALE)))
+        )
+        self.directions[player_id] = 0
+
+    def remove_player(self, player_id):
+        self.events.append((LEAVE, player_id, 0))
+        self.directions.pop(player_id, None)
+
+    def set_pressed_keys(self, player_id, pressed_keys):
+        # only changes are written, most ticks hold the same keys
+        direction = protocol.direction_of(pressed_keys)
+        if self.directions.get(player_id) != direction:
+            self.directions[player_id] = direction
+            self.events.append((DIRECTION, player_id, direction))
+
+    def drop_bubble(self, player_id):
+        self.events.append((DROP_BUBBLE, player_id, 0))
+
+    def use_item(self, player_id, idx):
+        self.events.append((USE_ITEM, player_id, idx))
+
+    def end_tick(self, simulation):
+        if self.events:
+            self.write(
+                INPUTS,
+                simulation.tick_count - 1,
+                b"".join(EVENT.pack(*event) for event in self.events),
+            )
+            self.events = []
+        if simulation.tick_count % self.keyframe_interval == 0:
+            self.write_keyframe(simulation)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.write(END, self.simulation.tick_count)
+        self.file.close()
+        self.simulation.recorder = None
+
+
+def apply_event(simulation, kind, player_id, value):
+    if kind == JOIN:
+        simulation.add_player(player_id, value / protocol.SPEED_SCALE)
+    elif kind == LEAVE:
+        simulation.remove_player(player_id)
+    elif kind == DIRECTION:
+        key = protocol.DIRECTION_KEYS[value]
+        simulation.set_pressed_keys(player_id, [key] if key else [])
+    elif kind == DROP_BUBBLE:
+        simulation.drop_bubble(player_id)
+    elif kind == USE_ITEM:
+        simulation.use_item(player_id, value)
+    else:
+        raise ReplayError(f"unknown input event {kind}")
+
+
+class Replay:
+    # a recorded match, played back headless at whatever speed the simulation
+    # runs. keyframes are only decoded when seeking needs them
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        try:
+            magic, version, meta_length = HEADER.unpack_from(data)
+        except struct.error:
+            raise ReplayError("not a replay")
+        if magic != MAGIC or version != VERSION:
+            raise ReplayError("unknown replay format")
+        offset = HEADER.size + meta_length
+        self.meta = json.loads(data[HEADER.size : offset])
+        self.tile_map = None
+        self.keyframe_ticks = []
+        self.keyframes = []
+        # tick -> [(kind, player_id, value)], in the order they were given
+        self.inputs = {}
+        self.end_tick = self.meta["start_tick"]
+        self.complete = False
+        while offset + RECORD.size <= len(data):
+            kind, tick, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            payload = data[offset : offset + length]
+            if len(payload) != length:
+                # the recording stopped mid record
+                break
+            offset += length
+            if kind == TILE_MAP:
+                self.tile_map = decode_tile_map(zlib.decompress(payload))
+            elif kind == KEYFRAME:
+                self.keyframe_ticks.append(tick)
+                self.keyframes.append(payload)
+            elif kind == INPUTS:
+                self.inputs[tick] = [
+                    EVENT.unpack_from(payload, i)
+                    for i in range(0, length, EVENT.size)
+                ]
+                tick += 1
+            elif kind == END:
+                self.complete = True
+            self.end_tick = max(self.end_tick, tick)
+        if self.tile_map is None or not self.keyframes:
+            raise ReplayError("replay has no tile map or keyframe")
+
+    def keyframe(self, index):
+        return json.loads(zlib.decompress(self.keyframes[index]))
+
+    def keyframe_index(self, tick):
+        # the last keyframe at or before tick
+        index = bisect.bisect_right(self.keyframe_ticks, tick) - 1
+        if index < 0:
+            raise ReplayError(f"replay starts at tick {self.keyframe_ticks[0]}")
+        return index
+
+    def start(self, index=0, asset_store=None, entity_store=None):
+        return Simulation.from_state(
+            self.tile_map, self.keyframe(index), asset_store, entity_store
+        )
+
+    def simulation_at(self, tick, asset_store=None, entity_store=None):
+        # the simulation as it was after tick ticks: the nearest keyframe at
+        # or before it, played forward from there
+        simulation = self.start(self.keyframe_index(tick), asset_store, entity_store)
+        self.play(simulation, tick)
+        return simulation
+
+    def play(self, simulation, until=None):
+        inputs = self.inputs
+        end = self.end_tick if until is None else min(until, self.end_tick)
+        while simulation.tick_count < end:
+            for event in inputs.get(simulation.tick_count, ()):
+                apply_event(simulation, *event)
+            simulation.step()
+        return simulation
+
+    def verify(self):
+        # plays the whole replay and returns the keyframe ticks whose state
+        # came out different, which would mean something is not deterministic
+        simulation = self.start()
+        mismatched = []
+        for index, tick in enumerate(self.keyframe_ticks[1:], 1):
+            self.play(simulation, tick)
+            # through json, so tuples and lists compare equal
+            if json.loads(json.dumps(simulation.state())) != self.keyframe(index):
+                mismatched.append(tick)
+        return mismatched
+
+
+def record_bots(path, map_name, num_players, num_ticks, seed, keyframe_interval):
+    # a match of RandomBots, the inputs a real match would get. the bots have
+    # their own rng, only what the simulation is told is recorded
+    simulation = Simulation(
+        load_tile_map(map_name, open_map_pack()), list(range(num_players)), seed=seed
+    )
+    recorder = ReplayRecorder(path, simulation, map_name, keyframe_interval)
+    rng = random.Random(seed)
+    bots = [RandomBot(player_id, rng) for player_id in range(num_players)]
+    try:
+        for _ in range(num_ticks):
+            for bot in bots:
+                bot.act(simulation)
+            simulation.step()
+    finally:
+        recorder.close()
+    return simulation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record matches of bots and play replays back headless"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    play_parser = subparsers.add_parser(
+        "play", help="play a replay as fast as it simulates"
+    )
+    play_parser.add_argument("path")
+    play_parser.add_argument(
+        "--seek",
+        type=int,
+        metavar="TICK",
+        help="start from the nearest keyframe and stop at TICK",
+    )
+    play_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check that playing back reproduces every keyframe",
+    )
+
+    record_parser = subparsers.add_parser(
+        "record", help="record a match of random bots"
+    )
+    record_parser.add_argument("path")
+    record_parser.add_argument("--map", default=config.MAP_NAME)
+    record_parser.add_argument("--players", type=int, default=4)
+    record_parser.add_argument("--ticks", type=int, default=60 * config.FPS)
+    record_parser.add_argument("--seed", type=int, default=0)
+    record_parser.add_argument("--keyframe-interval", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_bots(
+            args.path,
+            args.map,
+            args.players,
+            args.ticks,
+            args.seed,
+            args.keyframe_interval,
+        )
+        replay = Replay(args.path)
+        print(
+            f"recorded {replay.end_tick} ticks on {args.map}, "
+            f"{len(replay.keyframes)} keyframes"
+        )
+        sys.exit(0)
+
+    replay = Replay(args.path)
+    print(
+        f"{replay.meta['map_name']}, seed {replay.meta['seed']}, "
+        f"ticks {replay.meta['start_tick']}-{replay.end_tick}"
+        + ("" if replay.complete else " (cut short)")
+    )
+    if args.verify:
+        mismatched = replay.verify()
+        print(
+            f"{len(replay.keyframes) - len(mismatched)} of {len(replay.keyframes)} "
+            "keyframes reproduced"
+        )
+        if mismatched:
+            print(f"first differs at tick {mismatched[0]}")
+        sys.exit(1 if mismatched else 0)
+
+    start = time.perf_counter()
+    if args.seek is None:
+        # all of it, e.g. to time the simulation on a real match
+        simulation = replay.start()
+        first_tick = simulation.tick_count
+        replay.play(simulation)
+    else:
+        first_tick = replay.keyframe_ticks[replay.keyframe_index(args.seek)]
+        simulation = replay.simulation_at(args.seek)
+    elapsed = time.perf_counter() - start
+    played = simulation.tick_count - first_tick
+    print(
+        f"at tick {simulation.tick_count}: played {played} ticks from tick "
+        f"{first_tick} in {elapsed:.3f} s, "
+        f"{played / replay.meta['tick_rate'] / max(elapsed, 1e-9):.0f}x real time"
+    )
+    for player in simulation.grid.player_group:
+        print(
+            f"player {player.id} at ({player.rect.x:.1f}, {player.rect.y:.1f})"
+            + (" trapped" if player.is_trapped else "")
+        )
@@ -0,0 +1,249 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+import utils.config as config
+from bots import RandomBot
+from simulation import Simulation
+from utils.assets import HeadlessAssetStore
+from utils.stats import percentile
+from utils.tilemap import load_tile_map, open_map_pack
+
+
+class Room:
+    def __init__(self, room_id, tile_map, num_players, asset_store, seed=None):
+        self.room_id = room_id
+        self.tile_map = tile_map
+        self.num_players = num_players
+        self.asset_store = asset_store
+        self.rng = random.Random(room_id if seed is None else seed)
+        self.matches_played = 0
+        self.new_match()
+
+    def new_match(self):
+        player_ids = list(range(self.num_players))
+        # each match is seeded from the room, so a room replays the same
+        self.simulation = Simulation(
+            self.tile_map,
+            player_ids,
+            asset_store=self.asset_store,
+            seed=self.rng.getrandbits(32),
+        )
+        self.bots = [RandomBot(player_id, self.rng) for player_id in player_ids]
+
+    def step(self):
+        for bot in self.bots:
+            bot.act(self.simulation)
+        self.simulation.step()
+        if self.simulation.is_over():
+            self.matches_played += 1
+            self.new_match()
+
+
+def run_worker(worker_id, commands, reports, tick_rate, report_interval):
+    asset_store = HeadlessAssetStore(config.SPRITE_SIZE, config.GRID_SIZE)
+    # every worker maps the same pack, the pages are shared between them
+    map_pack = open_map_pack()
+    tile_maps = {}
+    rooms = {}
+    tick_duration = 1 / tick_rate
+    tick_times = []
+    overruns = 0
+    last_report = next_tick = time.perf_counter()
+
+    running = True
+    while running:
+        while True:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+            if command[0] == "create":
+                _, room_id, map_name, num_players = command
+                if map_name not in tile_maps:
+                    tile_maps[map_name] = load_tile_map(map_name, map_pack)
+                rooms[room_id] = Room(
+                    room_id, tile_maps[map_name], num_players, asset_store
+                )
+            elif command[0] == "close":
+                rooms.pop(command[1], None)
+            elif command[0] == "stop":
+                running = False
+
+        start = time.perf_counter()
+        for room in rooms.values():
+            room.step()
+        tick_times.append(time.perf_counter() - start)
+
+        if start - last_report >= report_interval:
+            tick_times.sort()
+            reports.put(
+                {
+                    "worker": worker_id,
+                    "rooms": len(rooms),
+                    "ticks": len(tick_times),
+                    "tick_ms_mean": 1000 * sum(tick_times) / len(tick_times),
+                    "tick_ms_p95": 1000 * percentile(tick_times, 0.95),
+                    "tick_ms_max": 1000 * tick_times[-1],
+                    "overruns": overruns,
+                }
+            )
+            tick_times = []
+            overruns = 0
+            last_report = start
+
+        next_tick += tick_duration
+        sleep_time = next_tick - time.perf_counter()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+        else:
+            # running behind, drop the missed ticks instead of bursting
+            overruns += 1
+            next_tick = time.perf_counter()
+
+
+class RoomServer:
+    def __init__(self, num_workers=None, tick_rate=config.FPS, report_interval=1.0):
+        self.num_workers = num_workers if num_workers else os.cpu_count() or 1
+        self.reports = multiprocessing.Queue()
+        self.workers = []
+        self.commands = []
+        self.room_counts = [0] * self.num_workers
+        self.worker_stats = [None] * self.num_workers
+        self.room_worker = {}
+        self.next_room_id = 0
+
+        for worker_id in range(self.num_workers):
+            commands = multiprocessing.Queue()
+            worker = multiprocessing.Process(
+                target=run_worker,
+                args=(worker_id, commands, self.reports, tick_rate, report_interval),
+                daemon=True,
+            )
+            worker.start()
+            self.commands.append(commands)
+            self.workers.append(worker)
+
+    def least_loaded_worker(self):
+        def load(worker_id):
+            stats = self.worker_stats[worker_id]
+            tick_ms = stats["tick_ms_mean"] if stats else 0
+            return (self.room_counts[worker_id], tick_ms)
+
+        return min(range(self.num_workers), key=load)
+
+    def create_room(self, map_name=config.MAP_NAME, num_players=4):
+        room_id = self.next_room_id
+        self.next_room_id += 1
+        worker_id = self.least_loaded_worker()
+        self.commands[worker_id].put(("create", room_id, map_name, num_players))
+        self.room_counts[worker_id] += 1
+        self.room_worker[room_id] = worker_id
+        return room_id
+
+    def close_room(self, room_id):
+        worker_id = self.room_worker.pop(room_id)
+        self.commands[worker_id].put(("close", room_id))
+        self.room_counts[worker_id] -= 1
+
+    def poll_stats(self):
+        while True:
+            try:
+                stats = self.reports.get_nowait()
+            except queue.Empty:
+                break
+            self.worker_stats[stats["worker"]] = stats
+        return self.worker_stats
+
+    def stop(self):
+        for commands in self.commands:
+            commands.put(("stop",))
+        for worker in self.workers:
+            worker.join()
+
+
+def measure_tick(rooms, num_ticks):
+    tick_times = []
+    for _ in range(num_ticks):
+        start = time.perf_counter()
+        for room in rooms:
+            room.step()
+        tick_times.append(time.perf_counter() - start)
+    tick_times.sort()
+    return percentile(tick_times, 0.95)
+
+
+def benchmark_rooms_per_core(map_name, num_players, tick_rate, seconds_per_step):
+    # grows the number of rooms stepped by a single process until the p95
+    # tick no longer fits in the tick budget, then bisects the boundary
+    asset_store = HeadlessAssetStore(config.SPRITE_SIZE, config.GRID_SIZE)
+    tile_map = load_tile_map(map_name, open_map_pack())
+    budget = 1 / tick_rate
+    num_ticks = max(1, int(tick_rate * seconds_per_step))
+    rooms = []
+
+    def sustains(num_rooms):
+        while len(rooms) < num_rooms:
+            rooms.append(Room(len(rooms), tile_map, num_players, asset_store))
+        p95 = measure_tick(rooms[:num_rooms], num_ticks)
+        print(f"{num_rooms:5d} rooms: p95 tick {p95 * 1000:.2f} ms")
+        return p95 <= budget
+
+    low, high = 0, 1
+    while sustains(high):
+        low, high = high, high * 2
+    while high - low > 1:
+        mid = (low + high) // 2
+        if sustains(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless bot-driven room server")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rooms", type=int, default=8)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--map", default=config.MAP_NAME)
+    parser.add_argument("--tick-rate", type=int, default=config.FPS)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="measure how many rooms a single core sustains at the tick rate",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        rooms_per_core = benchmark_rooms_per_core(
+            args.map, args.players, args.tick_rate, 2.0
+        )
+        cores = os.cpu_count() or 1
+        print(
+            f"{rooms_per_core} rooms/core at {args.tick_rate} ticks/s "
+            f"(~{rooms_per_core * cores} on {cores} cores)"
+        )
+    else:
+        server = RoomServer(args.workers, args.tick_rate)
+        for _ in range(args.rooms):
+            server.create_room(args.map, args.players)
+        end = time.perf_counter() + args.duration
+        try:
+            while time.perf_counter() < end:
+                time.sleep(1)
+                for stats in server.poll_stats():
+                    if stats:
+                        print(
+                            f"worker {stats['worker']}: {stats['rooms']} rooms, "
+                            f"tick mean {stats['tick_ms_mean']:.2f} ms, "
+                            f"p95 {stats['tick_ms_p95']:.2f} ms, "
+                            f"max {stats['tick_ms_max']:.2f} ms, "
+                            f"{stats['overruns']} overruns"
+                        )
+        finally:
+            server.stop()
@@ -0,0 +1,320 @@
+import random
+
+import pygame
+
+import entities
+import utils.config as config
+from grid import Grid
+from utils.assets import HeadlessAssetStore
+from utils.clock import FixedStepClock
+from utils.types import Items
+
+
+class Simulation:
+    def __init__(
+        self,
+        tile_map,
+        player_ids,
+        asset_store=None,
+        clock=None,
+        max_speed=3,
+        entity_store=None,
+        seed=None,
+    ):
+        self.tile_map = tile_map
+        # everything random in a match comes from here, so the seed and the
+        # inputs are enough to play it again
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.rng = random.Random(self.seed)
+        self.clock = clock if clock else FixedStepClock(config.FPS)
+        self.asset_store = (
+            asset_store
+            if asset_store
+            else HeadlessAssetStore(config.SPRITE_SIZE, config.GRID_SIZE)
+        )
+        players = [
+            entities.Player(self.asset_store, player_id, max_speed)
+            for player_id in player_ids
+        ]
+        self.grid = Grid(
+            len(tile_map),
+            config.SPRITE_SIZE,
+            self.asset_store,
+            players,
+            tile_map,
+            self.clock,
+            entity_store,
+            self.rng,
+        )
+        self.place_players(players)
+        self.pressed_keys = {player_id: [] for player_id in player_ids}
+        self.tick_count = 0
+        # told about every input and every tick, see replay.py
+        self.recorder = None
+
+    def spawn_corners(self):
+        last = self.grid.grid_size - 1
+        return [(0, 0), (last, last), (0, last), (last, 0)]
+
+    def place_player(self, player, tile):
+        if tile:
+            player.rect.topleft = (
+                tile[1] * self.grid.tile_size,
+                tile[0] * self.grid.tile_size,
+            )
+            player.update_hitbox()
+
+    def place_players(self, players):
+        corners = self.spawn_corners()
+        for idx, player in enumerate(players):
+            self.place_player(
+                player, self.grid.nearest_free_tile(*corners[idx % len(corners)])
+            )
+
+    def spawn_tile(self, player):
+        # the free tile nearest the first corner nobody else stands on, the
+        # first corner's if every one is taken
+        tile_size = self.grid.tile_size
+        tiles = [
+            self.grid.nearest_free_tile(*corner) for corner in self.spawn_corners()
+        ]
+        for tile in tiles:
+            if tile is None:
+                continue
+            rect = pygame.Rect(
+                tile[1] * tile_size, tile[0] * tile_size, tile_size, tile_size
+            )
+            if not any(
+                other is not player and other.rect.colliderect(rect)
+                for other in self.grid.player_group
+            ):
+                return tile
+        return tiles[0]
+
+    def add_player(self, player_id, max_speed=3):
+        if self.recorder:
+            self.recorder.add_player(player_id, max_speed)
+        player = entities.Player(self.asset_store, player_id, max_speed)
+        self.grid.addPlayer(player)
+        # only the new player, everyone else carries on where they are
+        self.place_player(player, self.spawn_tile(player))
+        self.pressed_keys[player_id] = []
+        return player
+
+    def remove_player(self, player_id):
+        if self.recorder:
+            self.recorder.remove_player(player_id)
+        player = self.grid.get_player(player_id)
+        if player:
+            player.kill()
+        self.pressed_keys.pop(player_id, None)
+
+    def set_pressed_keys(self, player_id, pressed_keys):
+        if self.recorder:
+            self.recorder.set_pressed_keys(player_id, pressed_keys)
+        self.pressed_keys[player_id] = pressed_keys
+
+    def drop_bubble(self, player_id):
+        if self.recorder:
+            self.recorder.drop_bubble(player_id)
+        player = self.grid.get_player(player_id)
+        if player:
+            player.drop_bubble(self.grid, self.asset_store)
+
+    def use_item(self, player_id, idx):
+        if self.recorder:
+            self.recorder.use_item(player_id, idx)
+        player = self.grid.get_player(player_id)
+        if player:
+            player.use_item(idx)
+
+    def step(self):
+        self.clock.tick()
+        self.grid.update(self.asset_store)
+        for player in self.grid.player_group.sprites():
+            player.update(
+                self.grid, self.grid.world_size, self.pressed_keys.get(player.id, [])
+            )
+        self.tick_count += 1
+        if self.recorder:
+            self.recorder.end_tick(self)
+
+    def run(self, num_ticks):
+        for _ in range(num_ticks):
+            self.step()
+
+    def is_over(self):
+        return len(self.grid.player_group) <= 1
+
+    def state(self):
+        # everything the next ticks depend on, as plain lists and numbers so
+        # it can be written as json. from_state() builds a simulation that
+        # carries on exactly as this one would
+        grid = self.grid
+        rng_version, rng_internal, rng_gauss = self.rng.getstate()
+        return {
+            "tick": self.tick_count,
+            "frame": self.clock.frame,
+            "rng": [rng_version, list(rng_internal), rng_gauss],
+            "pressed_keys": [
+                [player_id, list(keys)] for player_id, keys in self.pressed_keys.items()
+            ],
+            "players": [
+                {
+                    "id": player.id,
+                    "x": player.rect.x,
+                    "y": player.rect.y,
+                    "max_speed": player.max_speed,
+                    "vel": player.vel,
+                    "num_bubbles": player.num_bubbles,
+                    "explosion_range": player.explosion_range,
+                    "trapped": player.is_trapped,
+                    "inventory": [item.item_type.value for item in player.inventory],
+                    "flip_x": player.sprite_flip_x,
+                    "animation_state": player.animation_state,
+                    "move_row": player.move_row,
+                }
+                for player in grid.player_group
+            ],
+            "trapped_bubbles": [
+                [
+                    bubble.player.id,
+                    bubble.time_spawned,
+                    bubble.player.alive(),
+                    bubble.player.is_trapped,
+                ]
+                for bubble in grid.trapped_bubble_group
+            ],
+            "destroyed_blocks": sorted(grid.destroyed_blocks),
+            "bubble_groups": [
+                [
+                    lit_at,
+                    [
+                        [
+                            bubble.row,
+                            bubble.col,
+                            bubble.player_id,
+                            bubble.explosion_range,
+                        ]
+                        for bubble in group
+                    ],
+                ]
+                for group, lit_at in grid.bubble_groups
+            ],
+            "explosion_groups": [
+                [
+                    started,
+                    [
+                        [explosion.row, explosion.col, explosion.explosion_dir.value]
+                        for explosion in group
+                    ],
+                ]
+                for group, started in grid.explosion_groups
+            ],
+            "items": [
+                [item.row, item.col, item.item_type.value] for item in grid.item_group
+            ],
+        }
+
+    @classmethod
+    def from_state(cls, tile_map, state, asset_store=None, entity_store=None):
+        simulation = cls(
+            tile_map, [], asset_store=asset_store, entity_store=entity_store
+        )
+        simulation.load_state(state)
+        return simulation
+
+    def load_state(self, state):
+        # only valid on a simulation fresh from tile_map with no players
+        grid = self.grid
+        asset_store = self.asset_store
+        self.tick_count = state["tick"]
+        self.clock.frame = state["frame"]
+        rng_version, rng_internal, rng_gauss = state["rng"]
+        self.rng.setstate((rng_version, tuple(rng_internal), rng_gauss))
+        self.pressed_keys = {
+            player_id: list(keys) for player_id, keys in state["pressed_keys"]
+        }
+
+        for row, col in state["destroyed_blocks"]:
+            grid.remove_block(row, col)
+
+        players = {}
+        for player_state in state["players"]:
+            player = entities.Player(
+                asset_store, player_state["id"], player_state["max_speed"]
+            )
+            player.rect.topleft = (player_state["x"], player_state["y"])
+            player.update_hitbox()
+            player.vel = player_state["vel"]
+            player.num_bubbles = player_state["num_bubbles"]
+            player.explosion_range = player_state["explosion_range"]
+            player.is_trapped = player_state["trapped"]
+            for item_type in player_state["inventory"]:
+                item = grid.item_pools[Items(item_type)].factory(
+                    asset_store, 0, 0, Items(item_type), {}
+                )
+                player.inventory.append(item)
+            player.sprite_flip_x = player_state["flip_x"]
+            player.animation_state = player_state["animation_state"]
+            player.move_row = player_state["move_row"]
+            player.update_animation()
+            grid.addPlayer(player)
+            players[player.id] = player
+
+        for player_id, time_spawned, alive, trapped in state["trapped_bubbles"]:
+            if alive:
+                player = players[player_id]
+            else:
+                # the player left while trapped, the bubble stays until its
+                # time is up
+                player = entities.Player(asset_store, player_id, 0)
+                player.is_trapped = trapped
+            bubble = grid.trapped_bubble_pool.acquire(asset_store, player, grid.clock)
+            bubble.time_spawned = time_spawned
+            grid.trapped_bubble_group.add(bubble)
+
+        for lit_at, bubbles in state["bubble_groups"]:
+            # a group is one chain, so all of its bubbles share a set
+            group = grid.acquire_group("bubbles")
+            first = None
+            for row, col, owner, explosion_range in bubbles:
+                bubble = grid.bubble_pool.acquire(
+                    asset_store, row, col, owner, explosion_range
+                )
+                bubble.placed = lit_at
+                group.add(bubble)
+                grid.bubble_sets.add(bubble)
+                if first is None:
+                    first = bubble
+                grid.bubble_sets.union(first, bubble)
+                grid.index_blast(bubble)
+                grid.toggle_bubble(row, col)
+            group_info = [group, lit_at]
+            grid.bubble_groups.append(group_info)
+            if first is not None:
+                grid.bubble_group_of[grid.bubble_sets.find(first)] = group_info
+
+        for started, explosions in state["explosion_groups"]:
+            group = grid.acquire_group("explosions")
+            # explosions take their start from the clock they are given
+            clock = FixedStepClock(self.clock.tick_rate, started)
+            for row, col, direction in explosions:
+                group.add(
+                    grid.explosion_pool.acquire(
+                        asset_store,
+                        row,
+                        col,
+                        entities.Explosion.EXPLODE_DIR(direction),
+                        grid.tile_size,
+                        clock,
+                    )
+                )
+            grid.explosion_groups.append([group, started])
+
+        for row, col, item_type in state["items"]:
+            grid.item_group.add(
+                grid.item_pools[Items(item_type)].acquire(
+                    asset_store, row, col, Items(item_type), grid.items
+                )
+            )
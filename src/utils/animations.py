@@ -1,72 +1,122 @@
+from array import array
+from bisect import bisect_right
+
 from utils.types import Assets
-import entities
-import pygame
+from utils.transform_cache import TransformCache
+
+
+class Clip:
+    # one row of a sheet compiled to a timeline: frame i is shown until
+    # ends[i] ms after the animation started
+    def __init__(self, frames, ends, loop):
+        self.frames = frames
+        self.ends = array("d", ends)
+        self.loop = loop
+        self.duration = self.ends[-1] if self.ends else 0
+
+    def frame_at(self, elapsed):
+        if self.duration <= 0:
+            return self.frames[0]
+        if self.loop:
+            elapsed %= self.duration
+        return self.frames[min(bisect_right(self.ends, elapsed), len(self.frames) - 1)]
 
 
 class AnimationComponent:
-    def __init__(self, frames, asset_type, time_per_frame, animation_mappings):
+    # rotation of the unrotated frame for each explosion direction
+    EXPLOSION_ROTATIONS = {"RIGHT": 90, "UP": 180, "LEFT": 270}
+
+    def __init__(
+        self,
+        frames,
+        asset_type,
+        time_per_frame,
+        animation_mappings,
+        transform=None,
+        transform_cache=None,
+    ):
         self.frames = frames
+        # which variants the sheet config allows, built by transform_cache
+        self.transform = transform if transform else {}
+        self.transform_cache = transform_cache if transform_cache else TransformCache()
         self.animation_mappings = animation_mappings
-        self.animation_type_idx = 0
-        self.frame_idx = 0
         self.asset_type = asset_type
         self.time_per_frame = time_per_frame
-        self.timer = pygame.time.get_ticks()
-        self.prev_animiation_idx = None
+        self.clips = [self.compile_clip(row) for row in range(len(frames))]
 
-    def update_frame(self):
-        self.frame_idx = self.frame_idx % len(self.frames[self.animation_type_idx])
-        offset = 1 if self.asset_type == Assets.BUBBLE else 0
+    def compile_clip(self, row):
+        frames = self.frames[row]
         if isinstance(self.time_per_frame, dict):
-            animation_duration_dict = self.time_per_frame.get(self.animation_type_idx)
-            if isinstance(animation_duration_dict, dict):
-                for idx, time in animation_duration_dict.items():
-                    time_elapsed = pygame.time.get_ticks() - self.timer
-                    if time_elapsed <= time:
-                        self.frame_idx = idx
-                        break
-
-        elif isinstance(self.time_per_frame, int):
-            if pygame.time.get_ticks() - self.timer >= self.time_per_frame:
-                self.timer = pygame.time.get_ticks()
-                self.frame_idx = (self.frame_idx + 1) % (
-                    len(self.frames[self.animation_type_idx]) - offset
+            # {frame idx: ms} thresholds, played once and held on the last
+            schedule = self.time_per_frame.get(row)
+            if isinstance(schedule, dict):
+                return Clip(
+                    [frames[idx] for idx in schedule],
+                    list(schedule.values()),
+                    False,
                 )
+            return Clip(frames[:1], [], False)
+
+        # the last bubble frame is the pop, it isn't part of the idle loop
+        num_frames = len(frames) - (1 if self.asset_type == Assets.BUBBLE else 0)
+        return Clip(
+            frames[:num_frames],
+            [self.time_per_frame * (i + 1) for i in range(num_frames)],
+            True,
+        )
+
+    def can_flip_x(self, row):
+        transform_idx = self.transform.get("idx")
+        return bool(self.transform.get("flip_x")) and (
+            not transform_idx or transform_idx == row
+        )
+
+    def explosion_rotation(self, explosion_dir):
+        if not self.transform.get("rotate_cardinal"):
+            return 0
+        return AnimationComponent.EXPLOSION_ROTATIONS.get(explosion_dir.name, 0)
+
+
+class AnimationState:
+    # what one entity is playing; entities share an AnimationComponent but
+    # each keeps its own start time, row and variant
+    __slots__ = (
+        "animation",
+        "row",
+        "start",
+        "paused",
+        "flip_x",
+        "rotation",
+        "scale",
+        "alpha",
+    )
+
+    def __init__(
+        self, animation, row=0, start=0, flip_x=False, rotation=0, scale=1, alpha=255
+    ):
+        self.animation = animation
+        self.row = row
+        self.start = start
+        # a paused animation holds the first frame of its row
+        self.paused = False
+        self.flip_x = flip_x
+        self.rotation = rotation
+        self.scale = scale
+        self.alpha = alpha
+
+    def frame(self, now):
+        clip = self.animation.clips[self.row]
+        frame = clip.frames[0] if self.paused else clip.frame_at(now - self.start)
+        if self.flip_x or self.rotation or self.scale != 1 or self.alpha != 255:
+            frame = self.animation.transform_cache.get(
+                frame, self.scale, self.flip_x, False, self.rotation, self.alpha
+            )
+        return frame
+
 
-    def get_frame(self, entity=None, idx=None, flip_x=False):
-        if idx is not None:
-            if (
-                idx != self.animation_mappings["idle"]
-                and idx != self.animation_mappings["trapped"]
-            ):
-                self.animation_type_idx = idx
-            elif idx == self.animation_mappings["trapped"]:
-                if self.animation_type_idx != self.animation_mappings["trapped"]:
-                    self.prev_animiation_idx = self.animation_type_idx
-                    self.animation_type_idx = idx
-            else:
-                if self.animation_type_idx == self.animation_mappings["trapped"]:
-                    self.animation_type_idx = self.prev_animiation_idx
-                self.frame_idx = 0
-            if isinstance(self.frames[self.animation_type_idx][self.frame_idx], list):
-                if flip_x:
-                    return self.frames[self.animation_type_idx][self.frame_idx][1]
-                else:
-                    return self.frames[self.animation_type_idx][self.frame_idx][0]
-            else:
-                return self.frames[self.animation_type_idx][self.frame_idx]
-
-        elif isinstance(entity, entities.Explosion):
-            if entity.explosion_dir == entities.Explosion.EXPLODE_DIR.DOWN:
-                return self.frames[0][self.frame_idx][0]
-            elif entity.explosion_dir == entities.Explosion.EXPLODE_DIR.RIGHT:
-                return self.frames[0][self.frame_idx][1]
-            elif entity.explosion_dir == entities.Explosion.EXPLODE_DIR.UP:
-                return self.frames[0][self.frame_idx][2]
-            elif entity.explosion_dir == entities.Explosion.EXPLODE_DIR.LEFT:
-                return self.frames[0][self.frame_idx][3]
-            elif entity.explosion_dir == entities.Explosion.EXPLODE_DIR.CENTER:
-                return self.frames[0][self.frame_idx][0]
-
-        else:
-            return self.frames[self.animation_type_idx][self.frame_idx]
+def advance(groups, now):
+    # the one pass that moves every animated sprite in groups to its frame
+    # at now
+    for group in groups:
+        for sprite in group:
+            sprite.image = sprite.animation.frame(now)
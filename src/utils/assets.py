@@ -1,6 +1,9 @@
-from utils.animations import AnimationComponent
-from utils import spritesheets
+from utils.animations import AnimationComponent, AnimationState
+from utils import atlas, spritesheets
+from utils.transform_cache import TransformCache
 import pygame
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 
@@ -18,51 +21,165 @@ class Asset:
             if not isinstance(animation, AnimationComponent):
                 raise ValueError("Animation must be an instance of AnimationComponent")
             self.animation = animation
-            self.current_frame = self.get_current_frame()
         else:
             if not isinstance(image, pygame.Surface):
                 raise ValueError("image must be an instance of pygame.Surface")
             self.image = image
 
-    def get_current_frame(self, entity=None, idx=None, flip_x=None):
-        return self.animation.get_frame(entity, idx, flip_x)
+    def start_animation(self, row=0, start=0, **variant):
+        return AnimationState(self.animation, row, start, **variant)
 
     def get_animation_mapping(self, animation_type):
         if self.animation:
             return self.animation.animation_mappings[animation_type]
 
 
+class PendingAsset:
+    def __init__(self, load):
+        self.load = load
+
+
+class LazyAssets(dict):
+    # values are loaded the first time they are looked up and then kept;
+    # items() and values() load everything, loaded_items() only returns what
+    # has been looked up so far
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, PendingAsset):
+            value = value.load()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def pending_items(self):
+        return [
+            (key, value)
+            for key, value in super().items()
+            if isinstance(value, PendingAsset)
+        ]
+
+    def loaded_items(self):
+        return [
+            (key, value)
+            for key, value in super().items()
+            if not isinstance(value, PendingAsset)
+        ]
+
+
 class AssetStore(dict):
-    def __init__(self, asset_size, grid_size):
+    def __init__(
+        self,
+        asset_size,
+        grid_size,
+        cache=None,
+        preload=None,
+        workers=None,
+    ):
         super().__init__()
         self.asset_size = asset_size
         self.grid_size = grid_size
+        # threads preload() decodes on, pygame drops the GIL while decoding
+        # and scaling so sheets load side by side
+        self.workers = workers if workers else os.cpu_count() or 1
+        # a SpriteCache to load baked frames from instead of slicing sheets
+        self.cache = cache
+        # frame subsurface -> (atlas surface, source rect), see utils/atlas.py
+        self.atlas_areas = {}
+        # flipped, rotated, scaled and faded frames, made when first used
+        self.transform_cache = TransformCache()
         self.load_assets()
+        # keys like ("spritesheets", Assets.CHARACTER) to load before the
+        # first lookup; a partial key loads everything under it
+        for keys in preload if preload else []:
+            self.preload(*keys)
+
+    def load_frames(self, spritesheet):
+        def bake():
+            return spritesheet.get_sprites(self.asset_size, self.asset_size)
+
+        if self.cache is None:
+            return bake()
+        return self.cache.fetch(
+            spritesheet.path,
+            (spritesheet.path, spritesheet.config_path),
+            (self.asset_size, self.asset_size),
+            bake,
+        )
+
+    def load_image(self, path, size):
+        def bake():
+            return pygame.transform.scale(
+                pygame.image.load(path).convert_alpha(), size
+            )
+
+        if self.cache is None:
+            return bake()
+        return self.cache.fetch(path, (path,), size, bake)
+
+    def pack_frames(self, frames):
+        return atlas.pack_frames(frames, self.atlas_areas)
+
+    def load_spritesheet_asset(self, asset_type, asset_name, asset_spritesheet):
+        return Asset(
+            asset_type,
+            asset_name,
+            animation=AnimationComponent(
+                self.pack_frames(self.load_frames(asset_spritesheet)),
+                asset_type,
+                asset_spritesheet.time_per_frame,
+                asset_spritesheet.animation_mappings,
+                asset_spritesheet.config.get("transform"),
+                self.transform_cache,
+            ),
+        )
+
+    def load_static_asset(self, asset_type, asset_name, root, file):
+        config_file = os.path.join(root, "config.json")
+        config = None
+        if os.path.exists(config_file):
+            with open(config_file) as config_json:
+                config = json.load(config_json)
+        width = height = self.asset_size
+        if config:
+            x_scale_offset = config.get("x_scale_offset")
+            y_scale_offset = config.get("y_scale_offset")
+            width += x_scale_offset if x_scale_offset is not None else 0
+            height += y_scale_offset if y_scale_offset is not None else 0
+        map = self.load_image(
+            os.path.join(root, file),
+            (self.grid_size if asset_type == "maps" else width, self.grid_size if asset_type == "maps" else height),
+        )
+        return Asset(asset_type, asset_name, image=map, config=config)
 
     def load_assets(self):
-        self["spritesheets"] = {}
+        # only the directories are walked here, nothing is decoded until an
+        # asset is first looked up
+        self["spritesheets"] = LazyAssets()
         spritesheet_list = spritesheets.Spritesheets("assets/spritesheets")
         for asset_type, asset_dict in spritesheet_list.sheets.items():
             for asset_name, asset_data in asset_dict.items():
                 asset_spritesheet = asset_data.get("spritesheet")
                 if asset_spritesheet:
                     if asset_type not in self["spritesheets"]:
-                        self["spritesheets"][asset_type] = {}
-                    new_asset = Asset(
-                        asset_type,
-                        asset_name,
-                        animation=AnimationComponent(
-                            asset_spritesheet.get_sprites(
-                                self.asset_size, self.asset_size
-                            ),
+                        self["spritesheets"][asset_type] = LazyAssets()
+                    self["spritesheets"][asset_type][asset_name] = PendingAsset(
+                        functools.partial(
+                            self.load_spritesheet_asset,
                             asset_type,
-                            asset_spritesheet.time_per_frame,
-                            asset_spritesheet.animation_mappings
-                        ),
+                            asset_name,
+                            asset_spritesheet,
+                        )
                     )
-                    self["spritesheets"][asset_type][asset_name] = new_asset
 
-        self["static"] = {}
+        self["static"] = LazyAssets()
         for root, _, files in os.walk("assets/static"):
             for file in files:
                 path_tokens = root.split("/")
@@ -70,21 +187,49 @@ class AssetStore(dict):
                 asset_name = path_tokens[-1]
                 if file.split(".")[-1] == "png":
                     if asset_type not in self["static"]:
-                        self["static"][asset_type] = {}
-                    config_file = os.path.join(root, "config.json") 
-                    config = json.load(open(config_file)) if os.path.exists(config_file) else None
-                    width = height = self.asset_size
-                    if config:
-                        x_scale_offset = config.get("x_scale_offset")
-                        y_scale_offset = config.get("y_scale_offset")
-                        width += x_scale_offset if x_scale_offset is not None else 0
-                        height += y_scale_offset if y_scale_offset is not None else 0
-                    map = pygame.transform.scale(
-                        pygame.image.load(os.path.join(root, file)).convert_alpha(),
-                        (self.grid_size if asset_type == "maps" else width, self.grid_size if asset_type == "maps" else height),
+                        self["static"][asset_type] = LazyAssets()
+                    self["static"][asset_type][asset_name] = PendingAsset(
+                        functools.partial(
+                            self.load_static_asset, asset_type, asset_name, root, file
+                        )
                     )
-                    new_asset = Asset(asset_type, asset_name, image=map, config=config)
-                    self["static"][asset_type][asset_name] = new_asset
 
-    def __getitem__(self, key):
-        return super().__getitem__(key)
+    def preload(self, *keys):
+        assets = self
+        for key in keys:
+            assets = assets[key]
+        if not isinstance(assets, LazyAssets):
+            return
+
+        groups = [assets] + [
+            group
+            for _, group in assets.loaded_items()
+            if isinstance(group, LazyAssets)
+        ]
+        pending = [
+            (group, key, asset)
+            for group in groups
+            for key, asset in group.pending_items()
+        ]
+        if self.workers > 1 and len(pending) > 1:
+            with ThreadPoolExecutor(self.workers) as executor:
+                loaded = list(executor.map(lambda entry: entry[2].load(), pending))
+        else:
+            loaded = [asset.load() for _, _, asset in pending]
+        # stored back in lookup order, so the store ends up the same as if
+        # everything had been loaded one by one
+        for (group, key, _), asset in zip(pending, loaded):
+            group[key] = asset
+
+
+class HeadlessAssetStore(AssetStore):
+    # same layout and frame sizes as AssetStore, but nothing is decoded so a
+    # Grid can be simulated without a display
+    def load_frames(self, spritesheet):
+        return spritesheet.get_placeholder_sprites(self.asset_size, self.asset_size)
+
+    def load_image(self, path, size):
+        return pygame.Surface(size, pygame.SRCALPHA)
+
+    def pack_frames(self, frames):
+        return frames
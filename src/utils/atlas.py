@@ -0,0 +1,78 @@
+import pygame
+
+# every frame of a sheet is copied onto one atlas surface, packed in rows of
+# decreasing height, and replaced by a subsurface of it. code holding a frame
+# keeps working on it as before, while a draw pass can look the frame up in
+# areas and blit it straight from the atlas with a source rect
+
+
+def shelf_pack(sizes, max_width, padding):
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [None] * len(sizes)
+    x = y = shelf_height = width = 0
+    for i in order:
+        w, h = sizes[i]
+        if x and x + w > max_width:
+            y += shelf_height + padding
+            x = shelf_height = 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+        width = max(width, x - padding)
+    return positions, (width, y + shelf_height)
+
+
+def pack_frames(frames, areas, max_width=2048, padding=1):
+    # frames is the nested row/frame/variant list a Spritesheet returns; areas
+    # maps each new subsurface to (atlas, source rect)
+    surfaces = []
+    index = {}
+
+    def collect(node):
+        if isinstance(node, list):
+            for child in node:
+                collect(child)
+        elif node not in index:
+            index[node] = len(surfaces)
+            surfaces.append(node)
+
+    collect(frames)
+    if not surfaces:
+        return frames
+
+    sizes = [surface.get_size() for surface in surfaces]
+    positions, size = shelf_pack(
+        sizes, max(max_width, max(w for w, _ in sizes)), padding
+    )
+    atlas = pygame.Surface(size, pygame.SRCALPHA, surfaces[0])
+    atlas.fill((0, 0, 0, 0))
+    packed = []
+    for surface, position in zip(surfaces, positions):
+        # max against a cleared surface copies pixels exactly, a normal blit
+        # would blend semi-transparent ones into the black
+        atlas.blit(surface, position, special_flags=pygame.BLEND_RGBA_MAX)
+        area = pygame.Rect(position, surface.get_size())
+        subsurface = atlas.subsurface(area)
+        areas[subsurface] = (atlas, area)
+        packed.append(subsurface)
+
+    def rebuild(node):
+        if isinstance(node, list):
+            return [rebuild(child) for child in node]
+        return packed[index[node]]
+
+    return rebuild(frames)
+
+
+def blit_sprites(surface, sprites, areas, position=None):
+    # one blits() call for the whole layer; frames that are not in an atlas,
+    # like per-frame scaled ones, are blitted whole
+    blit_sequence = []
+    for sprite in sprites:
+        dest = position(sprite) if position else sprite.rect
+        area = areas.get(sprite.image)
+        if area:
+            blit_sequence.append((area[0], dest, area[1]))
+        else:
+            blit_sequence.append((sprite.image, dest))
+    surface.blits(blit_sequence, doreturn=False)
@@ -0,0 +1,35 @@
+import pygame
+
+
+class Camera:
+    # the part of the world shown on screen, in world pixels. it keeps its
+    # target in the middle but never shows anything outside the world; a world
+    # smaller than the view stays where it is
+    def __init__(self, view_size, world_size):
+        self.world = pygame.Rect((0, 0), world_size)
+        self.rect = pygame.Rect((0, 0), view_size)
+        self.rect.size = (
+            min(self.rect.width, self.world.width),
+            min(self.rect.height, self.world.height),
+        )
+
+    def follow(self, center):
+        # returns whether the view moved
+        topleft = self.rect.topleft
+        self.rect.center = (round(center[0]), round(center[1]))
+        self.rect.clamp_ip(self.world)
+        return self.rect.topleft != topleft
+
+    def position(self, position=None):
+        # position as given to blit_sprites and the dirty rect renderer, moved
+        # from world to screen coordinates. None while the view is at the
+        # origin, so the unscrolled case costs nothing
+        x, y = self.rect.topleft
+        if not x and not y:
+            return position
+        if position:
+            return lambda sprite: (position(sprite)[0] - x, position(sprite)[1] - y)
+        return lambda sprite: (sprite.rect.x - x, sprite.rect.y - y)
+
+    def to_screen(self, rect):
+        return rect.move(-self.rect.x, -self.rect.y)
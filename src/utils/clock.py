@@ -0,0 +1,24 @@
+import pygame
+
+
+class Clock:
+    def get_ticks(self):
+        return pygame.time.get_ticks()
+
+    def tick(self):
+        return 0
+
+
+class FixedStepClock(Clock):
+    def __init__(self, tick_rate, start_ticks=0):
+        self.tick_rate = tick_rate
+        self.step = 1000 / tick_rate
+        self.start_ticks = start_ticks
+        self.frame = 0
+
+    def get_ticks(self):
+        return self.start_ticks + self.frame * self.step
+
+    def tick(self):
+        self.frame += 1
+        return self.step
@@ -0,0 +1,86 @@
+import pygame
+
+
+class DirtyRectRenderer:
+    # redraws only where a sprite moved, changed frame, appeared or went away,
+    # and pushes just those rects to the display. layers are (sprites,
+    # position) pairs in draw order, position being None to draw at
+    # sprite.rect or a function returning the sprite's destination. sprites
+    # are only drawn inside view, the whole screen if not given
+    def __init__(self, screen, background, areas, max_dirty_fraction=0.5, view=None):
+        self.screen = screen
+        self.background = background
+        self.areas = areas
+        self.view = view if view else screen.get_rect()
+        # past this much of the screen a full redraw and flip is cheaper
+        self.max_dirty_area = (
+            max_dirty_fraction * screen.get_width() * screen.get_height()
+        )
+        self.drawn = {}
+        self.invalid_rects = []
+        self.full_redraw = True
+        self.full_redraws = 0
+        self.partial_redraws = 0
+
+    def invalidate(self, rect=None):
+        # a rect of the background that changed, or the whole screen
+        if rect is None:
+            self.full_redraw = True
+        else:
+            self.invalid_rects.append(rect)
+
+    def draw(self, layers):
+        blit_sequence = []
+        dests = []
+        current = {}
+        for sprites, position in layers:
+            for sprite in sprites:
+                image = sprite.image
+                x, y = position(sprite) if position else sprite.rect.topleft
+                dest = pygame.Rect(int(x), int(y), *image.get_size())
+                area = self.areas.get(image)
+                if area:
+                    blit_sequence.append((area[0], dest, area[1]))
+                else:
+                    blit_sequence.append((image, dest))
+                dests.append(dest)
+                current[sprite] = (image, dest)
+
+        dirty = {tuple(rect) for rect in self.invalid_rects}
+        self.invalid_rects = []
+        for sprite, state in self.drawn.items():
+            if current.get(sprite) != state:
+                dirty.add(tuple(state[1]))
+        for sprite, state in current.items():
+            if self.drawn.get(sprite) != state:
+                dirty.add(tuple(state[1]))
+        self.drawn = current
+
+        dirty = [self.view.clip(rect) for rect in dirty]
+        dirty = [rect for rect in dirty if rect]
+        if (
+            self.full_redraw
+            or sum(rect.width * rect.height for rect in dirty) > self.max_dirty_area
+        ):
+            self.full_redraw = False
+            self.full_redraws += 1
+            self.screen.blit(self.background, (0, 0))
+            self.screen.set_clip(self.view)
+            self.screen.blits(blit_sequence, doreturn=False)
+            self.screen.set_clip(None)
+            pygame.display.flip()
+            return
+
+        self.partial_redraws += 1
+        for rect in dirty:
+            # everything overlapping the rect is redrawn in layer order, clipped
+            # so nothing outside it is touched
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            self.screen.blits(
+                [blit_sequence[i] for i in rect.collidelistall(dests)],
+                doreturn=False,
+            )
+        self.screen.set_clip(None)
+        if dirty:
+            pygame.display.update(dirty)
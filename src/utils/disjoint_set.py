@@ -0,0 +1,38 @@
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        root = item
+        while self.parent[root] is not root:
+            root = self.parent[root]
+        while self.parent[item] is not root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a is root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        return root_a
+
+    def discard_set(self, items):
+        # only valid when items is a whole set, otherwise other members could
+        # be left pointing at a removed parent
+        for item in items:
+            self.parent.pop(item, None)
+            self.size.pop(item, None)
@@ -0,0 +1,157 @@
+from array import array
+from operator import attrgetter
+
+from utils.types import Items
+
+ITEM_TYPES = list(Items)
+
+
+class EntityView:
+    # a sprite's row read through properties, with nothing stored per view but
+    # the table and the sprite. rows move when others are removed, so the row
+    # is looked up on every access
+    __slots__ = ("table", "sprite")
+
+    def __init__(self, table, sprite):
+        self.table = table
+        self.sprite = sprite
+
+
+def column_property(column):
+    def read(view):
+        return column[view.table.slots[view.sprite]]
+
+    def write(view, value):
+        column[view.table.slots[view.sprite]] = value
+
+    return property(read, write)
+
+
+class EntityTable:
+    # one array per field instead of one object per entity. fields are
+    # (name, typecode, read) with read taking the sprite a row mirrors. a
+    # removed row is filled with the last one, so the columns stay dense and a
+    # scan never steps over dead rows
+    def __init__(self, fields):
+        self.fields = fields
+        self.columns = {name: array(typecode) for name, typecode, _ in fields}
+        # when each row was added, rows being moved out of order by removals
+        self.added = array("Q")
+        self.additions = 0
+        self.sprites = []
+        self.slots = {}
+        namespace = {"__slots__": ()}
+        for name, column in self.columns.items():
+            namespace[name] = column_property(column)
+        self.view_type = type("EntityView", (EntityView,), namespace)
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def __contains__(self, sprite):
+        return sprite in self.slots
+
+    def add(self, sprite):
+        if sprite in self.slots:
+            return
+        self.additions += 1
+        self.slots[sprite] = len(self.sprites)
+        self.sprites.append(sprite)
+        self.added.append(self.additions)
+        for name, _, read in self.fields:
+            self.columns[name].append(read(sprite))
+
+    def remove(self, sprite):
+        slot = self.slots.pop(sprite, None)
+        if slot is None:
+            return
+        last = len(self.sprites) - 1
+        if slot != last:
+            moved = self.sprites[last]
+            self.sprites[slot] = moved
+            self.slots[moved] = slot
+            self.added[slot] = self.added[last]
+            for column in self.columns.values():
+                column[slot] = column[last]
+        self.sprites.pop()
+        self.added.pop()
+        for column in self.columns.values():
+            column.pop()
+
+    def scan(self, *names, ordered=False):
+        # the named fields of every row, as tuples, without touching a sprite.
+        # ordered gives them in the order the sprites were added
+        columns = [self.columns[name] for name in names]
+        if not ordered:
+            return zip(*columns)
+        return [row[1:] for row in sorted(zip(self.added, *columns))]
+
+    def by_tile(self, name):
+        # {(row, col): value} built without a python loop. where two rows share
+        # a tile the one added last wins, as it would going over the sprites
+        columns = self.columns
+        tiles = dict(zip(zip(columns["row"], columns["col"]), columns[name]))
+        if len(tiles) < len(self.sprites):
+            tiles = {
+                (row, col): value
+                for row, col, value in self.scan("row", "col", name, ordered=True)
+            }
+        return tiles
+
+    def view(self, sprite):
+        return self.view_type(self, sprite)
+
+    def views(self):
+        return [self.view_type(self, sprite) for sprite in self.sprites]
+
+    def nbytes(self):
+        return sum(
+            len(column) * column.itemsize for column in self.columns.values()
+        ) + len(self.added) * self.added.itemsize
+
+
+class EntityStore:
+    # column mirror of the bubbles, explosions and items on a grid, kept up to
+    # date by the TileGroups it watches. with one, Grid.update collides
+    # players with explosions and checks fuses from the columns
+    def __init__(self):
+        self.bubbles = EntityTable(
+            (
+                ("row", "H", attrgetter("row")),
+                ("col", "H", attrgetter("col")),
+                ("owner", "i", attrgetter("player_id")),
+                ("range", "H", attrgetter("explosion_range")),
+                ("placed", "d", attrgetter("placed")),
+            )
+        )
+        self.explosions = EntityTable(
+            (
+                ("row", "H", attrgetter("row")),
+                ("col", "H", attrgetter("col")),
+                ("direction", "B", lambda explosion: explosion.explosion_dir.value),
+                ("spawned", "d", attrgetter("timer")),
+            )
+        )
+        self.items = EntityTable(
+            (
+                ("row", "H", attrgetter("row")),
+                ("col", "H", attrgetter("col")),
+                ("item_type", "B", lambda item: ITEM_TYPES.index(item.item_type)),
+            )
+        )
+
+    def tables(self):
+        return {
+            "bubbles": self.bubbles,
+            "explosions": self.explosions,
+            "items": self.items,
+        }
+
+    def stats(self):
+        return {
+            name: {
+                "live": len(table),
+                "bytes": table.nbytes(),
+            }
+            for name, table in self.tables().items()
+        }
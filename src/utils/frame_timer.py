@@ -0,0 +1,172 @@
+import csv
+import json
+import time
+from array import array
+
+import pygame
+
+from utils.stats import percentile
+
+
+class FrameTimer:
+    # how long each phase of the last size frames took. a frame is begin(),
+    # then mark(phase) after each phase, then end(); a phase marked more than
+    # once in a frame adds up. a phase only gets a sample for the frames it
+    # ran in, so one that is sometimes skipped is not averaged with zeros.
+    # disabled, every call returns straight away
+    def __init__(self, size=600, enabled=False):
+        self.size = size
+        self.enabled = enabled
+        # phase -> ring buffer of seconds, in the order phases were first seen
+        self.samples = {}
+        # phase -> ring buffer of the frame each sample is from
+        self.sample_frames = {}
+        # phase -> samples recorded, including those overwritten since
+        self.counts = {}
+        self.frames = 0
+        self.current = {}
+        self.last = 0
+
+    def begin(self):
+        if self.enabled:
+            self.current.clear()
+            self.last = time.perf_counter()
+
+    def mark(self, phase):
+        # the time since begin() or the previous mark went to phase
+        if self.enabled:
+            now = time.perf_counter()
+            self.current[phase] = self.current.get(phase, 0) + now - self.last
+            self.last = now
+
+    def end(self):
+        if not self.enabled:
+            return
+        self.current["frame"] = sum(self.current.values())
+        for phase, seconds in self.current.items():
+            samples = self.samples.get(phase)
+            if samples is None:
+                samples = self.samples[phase] = array("d", bytes(8 * self.size))
+                self.sample_frames[phase] = array("Q", bytes(8 * self.size))
+                self.counts[phase] = 0
+            slot = self.counts[phase] % self.size
+            samples[slot] = seconds
+            self.sample_frames[phase][slot] = self.frames
+            self.counts[phase] += 1
+        self.current.clear()
+        self.frames += 1
+
+    def oldest_first(self, phase, ring):
+        count = self.counts[phase]
+        if count < self.size:
+            return ring[:count]
+        slot = count % self.size
+        return ring[slot:] + ring[:slot]
+
+    def recent(self, phase):
+        # the recorded samples of phase, oldest first
+        return self.oldest_first(phase, self.samples[phase])
+
+    def stats(self):
+        # milliseconds per phase over the samples in the buffers
+        stats = {}
+        for phase in self.samples:
+            recent = sorted(self.recent(phase))
+            if not recent:
+                continue
+            stats[phase] = {
+                "mean": 1000 * sum(recent) / len(recent),
+                "p50": 1000 * percentile(recent, 0.50),
+                "p95": 1000 * percentile(recent, 0.95),
+                "p99": 1000 * percentile(recent, 0.99),
+                "max": 1000 * recent[-1],
+            }
+        return stats
+
+    def by_frame(self, phase):
+        # {frame: seconds} for the buffered samples of phase
+        return dict(
+            zip(
+                self.oldest_first(phase, self.sample_frames[phase]),
+                self.recent(phase),
+            )
+        )
+
+    def dump(self, path):
+        # a .csv gets one row per frame in ms, left empty where a phase did
+        # not run, anything else the stats and the samples as json
+        phases = list(self.samples)
+        if path.endswith(".csv"):
+            columns = [self.by_frame(phase) for phase in phases]
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(phases)
+                for frame in range(max(0, self.frames - self.size), self.frames):
+                    writer.writerow(
+                        [
+                            f"{1000 * column[frame]:.4f}" if frame in column else ""
+                            for column in columns
+                        ]
+                    )
+            return
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "frames": self.frames,
+                    "buffered": min(self.frames, self.size),
+                    "stats_ms": self.stats(),
+                    "samples_ms": {
+                        phase: [1000 * seconds for seconds in self.recent(phase)]
+                        for phase in phases
+                    },
+                },
+                file,
+                indent=4,
+            )
+
+
+class FrameTimeOverlay:
+    # the timer's stats as a table, rendered again every refresh frames rather
+    # than every frame
+    COLUMNS = ("p50", "p95", "p99")
+
+    def __init__(self, position, refresh=30, font_size=24, column_width=70):
+        self.position = position
+        self.refresh = refresh
+        self.font = pygame.font.Font(None, font_size)
+        self.column_width = column_width
+        self.surface = None
+        self.rendered_at = None
+
+    def render(self, timer):
+        stats = timer.stats()
+        rows = [("ms",) + FrameTimeOverlay.COLUMNS]
+        for phase, phase_stats in stats.items():
+            rows.append(
+                (phase,)
+                + tuple(f"{phase_stats[key]:.2f}" for key in FrameTimeOverlay.COLUMNS)
+            )
+        name_width = max(self.font.size(row[0])[0] for row in rows) + 10
+        line_height = self.font.get_linesize()
+        surface = pygame.Surface(
+            (
+                name_width + self.column_width * len(FrameTimeOverlay.COLUMNS),
+                line_height * len(rows),
+            )
+        )
+        for i, row in enumerate(rows):
+            y = i * line_height
+            surface.blit(self.font.render(row[0], True, "white"), (0, y))
+            for j, cell in enumerate(row[1:]):
+                # right aligned in its column
+                text = self.font.render(cell, True, "white")
+                x = name_width + self.column_width * (j + 1) - text.get_width()
+                surface.blit(text, (x, y))
+        return surface
+
+    def draw(self, screen, timer):
+        # returns the rect drawn over
+        if self.rendered_at is None or timer.frames - self.rendered_at >= self.refresh:
+            self.surface = self.render(timer)
+            self.rendered_at = timer.frames
+        return screen.blit(self.surface, self.position)
@@ -0,0 +1,50 @@
+import pygame
+
+
+class Pool:
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        # acquired and not released yet
+        self.in_use = 0
+
+    def acquire(self, *args):
+        if self.free:
+            obj = self.free.pop()
+            reset = getattr(obj, "reset", None)
+            if reset:
+                reset(*args)
+            self.reused += 1
+        else:
+            obj = self.factory(*args)
+            self.created += 1
+        self.in_use += 1
+        if isinstance(obj, PooledSprite):
+            obj.pool = self
+        return obj
+
+    def release(self, obj):
+        self.in_use -= 1
+        self.free.append(obj)
+
+    def stats(self):
+        return {
+            "created": self.created,
+            "reused": self.reused,
+            "free": len(self.free),
+            "in_use": self.in_use,
+        }
+
+
+class PooledSprite(pygame.sprite.Sprite):
+    def __init__(self):
+        super(PooledSprite, self).__init__()
+        self.pool = None
+
+    def kill(self):
+        super(PooledSprite, self).kill()
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            pool.release(self)
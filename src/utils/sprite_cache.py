@@ -0,0 +1,115 @@
+import glob
+import hashlib
+import json
+import os
+import struct
+import threading
+
+import pygame
+
+# a baked entry is HEADER, a JSON layout and then the raw RGBA pixels of
+# every surface in the layout, in the order they appear in it. bump
+# CACHE_VERSION whenever the layout or the slicing in Spritesheet changes
+MAGIC = b"BNBS"
+CACHE_VERSION = 2
+HEADER = struct.Struct("<4sBI")
+PIXEL_FORMAT = "RGBA"
+
+
+class SpriteCache:
+    def __init__(self, path=".cache/sprites"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # AssetStore.preload fetches from several threads
+        self.lock = threading.Lock()
+
+    def key(self, dependencies, params):
+        digest = hashlib.sha1(str(CACHE_VERSION).encode())
+        for dependency in dependencies:
+            with open(dependency, "rb") as file:
+                digest.update(file.read())
+        digest.update(json.dumps(params).encode())
+        return digest.hexdigest()
+
+    def entry_path(self, source_path, key=None):
+        name = os.path.normpath(source_path).replace(os.sep, "_")
+        return os.path.join(self.path, f"{name}.{key if key else '*'}.bake")
+
+    def fetch(self, source_path, dependencies, params, bake):
+        # returns what bake() would, baking and storing it on a miss; any
+        # change to a dependency's bytes or to params changes the key
+        key = self.key(dependencies, params)
+        baked = self.load(self.entry_path(source_path, key))
+        if baked is not None:
+            with self.lock:
+                self.hits += 1
+            return baked
+
+        with self.lock:
+            self.misses += 1
+        baked = bake()
+        self.store(source_path, key, baked)
+        return baked
+
+    def load(self, path):
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            magic, version, layout_size = HEADER.unpack_from(data)
+            if magic != MAGIC or version != CACHE_VERSION:
+                return None
+            layout = json.loads(data[HEADER.size : HEADER.size + layout_size])
+        except (struct.error, ValueError):
+            return None
+        offset = HEADER.size + layout_size
+
+        def build(node):
+            nonlocal offset
+            if isinstance(node, list):
+                return [build(child) for child in node]
+            width, height = node["size"]
+            end = offset + width * height * 4
+            if end > len(data):
+                raise ValueError("truncated entry")
+            surface = pygame.image.frombytes(
+                data[offset:end], (width, height), PIXEL_FORMAT
+            ).convert_alpha()
+            offset = end
+            return surface
+
+        try:
+            return build(layout)
+        except ValueError:
+            return None
+
+    def store(self, source_path, key, baked):
+        pixels = []
+
+        def describe(node):
+            if isinstance(node, list):
+                return [describe(child) for child in node]
+            pixels.append(pygame.image.tobytes(node, PIXEL_FORMAT))
+            return {"size": list(node.get_size())}
+
+        layout = json.dumps(describe(baked)).encode()
+        os.makedirs(self.path, exist_ok=True)
+        # entries baked from an older version of the source are never
+        # looked up again
+        for stale in glob.glob(self.entry_path(source_path)):
+            os.remove(stale)
+        path = self.entry_path(source_path, key)
+        with open(path + ".tmp", "wb") as file:
+            file.write(HEADER.pack(MAGIC, CACHE_VERSION, len(layout)))
+            file.write(layout)
+            for data in pixels:
+                file.write(data)
+        # a start that is killed mid-write never leaves a partial entry behind
+        os.replace(path + ".tmp", path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
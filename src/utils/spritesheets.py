@@ -7,32 +7,50 @@ from utils.config import convert_indices_to_int
 class Spritesheet:
     def __init__(self, path, config_path):
         self.path = path
+        self.config_path = config_path
         self.config = self.__read_config(config_path)
         self.time_per_frame = self.config.get("time_per_frame")
-        self.sheet = pygame.image.load(path).convert_alpha()
-        self.width, self.height = self.sheet.get_size()
+        self.sheet = None
         self.animation_mappings = self.config.get("animation_mappings")
 
     def __read_config(self, path):
-        file = open(path)
-        return convert_indices_to_int(json.load(file))
+        with open(path) as file:
+            return convert_indices_to_int(json.load(file))
+
+    def __load_sheet(self):
+        self.sheet = pygame.image.load(self.path).convert_alpha()
+        self.width, self.height = self.sheet.get_size()
+
+    def get_placeholder_sprites(self, output_width, output_height):
+        # same frame layout as get_sprites, without decoding the sheet, for
+        # headless simulation where nothing is ever drawn
+        blank = pygame.Surface((output_width, output_height), pygame.SRCALPHA)
+
+        sprite_list = []
+        for i in range(self.config["rows"]):
+            only = self.config.get("only")
+            if only:
+                if i not in only:
+                    continue
+            sprite_list.append([blank] * self.config["cols"])
+        return sprite_list
 
     def get_sprites(
         self,
         output_width,
         output_height,
     ):
+        if self.sheet is None:
+            self.__load_sheet()
+
         if "colorkey" in self.config:
             self.sheet.set_colorkey(self.config["colorkey"])
             if "ignore_colors" in self.config:
-                width = self.sheet.get_size()[0]
-                height = self.sheet.get_size()[1]
-                for x in range(width):
-                    for y in range(height):
-                        for color in self.config["ignore_colors"]:
-                            if tuple(self.sheet.get_at((x, y))) == pygame.Color(color):
-                                self.sheet.set_at((x, y), self.config["colorkey"])
-                                break
+                # exact matches only (distance 0), like comparing get_at results
+                colorkey = pygame.Color(self.config["colorkey"])
+                with pygame.PixelArray(self.sheet) as pixels:
+                    for color in self.config["ignore_colors"]:
+                        pixels.replace(pygame.Color(color), colorkey)
 
         sprite_list = []
         sprite_width = self.width / self.config["cols"]
@@ -80,47 +98,9 @@ class Spritesheet:
                         ),
                     )
 
-                    if "transform" in self.config:
-                        if (
-                            not self.config["transform"].get("flip_x")
-                            and not self.config["transform"].get("flip_y")
-                            and not self.config["transform"].get("flip_xy")
-                            and not self.config["transform"].get("rotate_cardinal")
-                        ):
-                            sprites.append(scaled_image)
-                        else:
-                            transformed_sprites = []
-                            transform_idx = self.config["transform"].get("idx")
-                            if self.config["transform"].get("flip_x"):
-                                if not transform_idx or transform_idx == i:
-                                    transformed_sprites.append(
-                                        pygame.transform.flip(scaled_image, True, False)
-                                    )
-                            if self.config["transform"].get("flip_y"):
-                                if not transform_idx or transform_idx == i:
-                                    transformed_sprites.append(
-                                        pygame.transform.flip(scaled_image, False, True)
-                                    )
-                            if self.config["transform"].get("flip_xy"):
-                                if not transform_idx or transform_idx == i:
-                                    transformed_sprites.append(
-                                        pygame.transform.flip(scaled_image, True, True)
-                                    )
-                            if self.config["transform"].get("rotate_cardinal"):
-                                if not transform_idx or transform_idx == i:
-                                    transformed_sprites.append(
-                                        pygame.transform.rotate(scaled_image, 90)
-                                    )
-                                    transformed_sprites.append(
-                                        pygame.transform.rotate(scaled_image, 180)
-                                    )
-                                    transformed_sprites.append(
-                                        pygame.transform.rotate(scaled_image, 270)
-                                    )
-
-                            sprites.append([scaled_image] + transformed_sprites)
-                    else:
-                        sprites.append(scaled_image)
+                    # flip and rotate variants named in the config's
+                    # "transform" are made on demand by the TransformCache
+                    sprites.append(scaled_image)
             sprite_list.append(sprites)
         return sprite_list
 
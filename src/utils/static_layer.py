@@ -0,0 +1,148 @@
+from collections import OrderedDict
+
+import pygame
+
+from utils.atlas import blit_sprites
+
+
+class StaticLayer:
+    # the ground tiled over the world with every sprite of groups drawn over
+    # it, in order. it is composited in chunk_size squares the first time each
+    # is shown, keeping the max_chunks shown most recently, so a large map
+    # costs what is on screen. groups are TileGroups; when sprites leave or
+    # join one, only the area they covered is composited again
+    def __init__(
+        self, ground, world_size, groups, areas, chunk_size=512, max_chunks=32
+    ):
+        self.ground = ground
+        self.world = pygame.Rect((0, 0), world_size)
+        self.groups = groups
+        self.areas = areas
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+        self.changed = []
+        for group in groups:
+            group.watchers.append(self)
+
+    def add(self, sprite):
+        self.changed.append(sprite.rect.copy())
+
+    def remove(self, sprite):
+        self.changed.append(sprite.rect.copy())
+
+    def chunk_keys(self, rect):
+        rect = rect.clip(self.world)
+        if not rect:
+            return []
+        first_x = rect.left // self.chunk_size
+        first_y = rect.top // self.chunk_size
+        last_x = (rect.right - 1) // self.chunk_size
+        last_y = (rect.bottom - 1) // self.chunk_size
+        return [
+            (x, y)
+            for y in range(first_y, last_y + 1)
+            for x in range(first_x, last_x + 1)
+        ]
+
+    def chunk_rect(self, key):
+        return pygame.Rect(
+            key[0] * self.chunk_size,
+            key[1] * self.chunk_size,
+            self.chunk_size,
+            self.chunk_size,
+        ).clip(self.world)
+
+    def chunk(self, key):
+        surface = self.chunks.get(key)
+        if surface is not None:
+            self.chunks.move_to_end(key)
+            return surface
+        rect = self.chunk_rect(key)
+        surface = pygame.Surface(rect.size)
+        self.render(surface, rect.topleft, rect)
+        self.chunks[key] = surface
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
+        return surface
+
+    def render(self, surface, origin, rect):
+        # composites the world rect onto surface, whose topleft is at world
+        # position origin
+        ox, oy = origin
+        surface.set_clip(rect.move(-ox, -oy))
+        surface.fill("black")
+        ground_width, ground_height = self.ground.get_size()
+        for y in range(
+            rect.top - rect.top % ground_height, rect.bottom, ground_height
+        ):
+            for x in range(
+                rect.left - rect.left % ground_width, rect.right, ground_width
+            ):
+                surface.blit(self.ground, (x - ox, y - oy))
+        for group in self.groups:
+            # sprites can hang over the tiles next to theirs
+            margin = group.tile_size
+            sprites = [
+                sprite
+                for sprite in group.sprites_in(rect.inflate(2 * margin, 2 * margin))
+                if sprite.rect.colliderect(rect)
+            ]
+            blit_sprites(
+                surface,
+                sprites,
+                self.areas,
+                lambda sprite: (sprite.rect.x - ox, sprite.rect.y - oy),
+            )
+        surface.set_clip(None)
+
+    def update(self):
+        # returns the world rects that were composited again
+        changed, self.changed = self.changed, []
+        for rect in changed:
+            for key in self.chunk_keys(rect):
+                if key in self.chunks:
+                    chunk_rect = self.chunk_rect(key)
+                    self.render(
+                        self.chunks[key], chunk_rect.topleft, rect.clip(chunk_rect)
+                    )
+        return changed
+
+    def draw(self, surface, view, dest=(0, 0), rect=None):
+        # the part of the world under view onto surface at dest, or only the
+        # world rect part of it
+        area = view.clip(rect) if rect else view
+        for key in self.chunk_keys(area):
+            chunk = self.chunk(key)
+            chunk_rect = self.chunk_rect(key)
+            part = area.clip(chunk_rect)
+            surface.blit(
+                chunk,
+                (dest[0] + part.x - view.x, dest[1] + part.y - view.y),
+                part.move(-chunk_rect.x, -chunk_rect.y),
+            )
+
+
+def overlapping(group, rects):
+    # sprites of a static layer that something in rects was drawn over, and
+    # that have to be drawn again on top to keep the original draw order.
+    # only the tiles under each rect are looked at, so the size of the map
+    # does not matter; the result is in row-major order like the map
+    margin = group.tile_size
+    found = {}
+    for rect in rects:
+        for sprite in group.sprites_in(rect.inflate(2 * margin, 2 * margin)):
+            if sprite not in found and sprite.rect.colliderect(rect):
+                found[sprite] = None
+    return sorted(found, key=lambda sprite: (sprite.row, sprite.col))
+
+
+def sprite_rects(layers):
+    rects = []
+    for sprites, position in layers:
+        for sprite in sprites:
+            if position:
+                rects.append(pygame.Rect(position(sprite), sprite.image.get_size()))
+            else:
+                rects.append(sprite.rect)
+    return rects
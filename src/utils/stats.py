@@ -0,0 +1,5 @@
+def percentile(sorted_values, fraction):
+    # nearest rank, None for no values
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
@@ -0,0 +1,73 @@
+import bisect
+import math
+
+import pygame
+
+
+def tile_range(rect, tile_size):
+    # (first_row, last_row, first_col, last_col) of the tiles rect touches
+    return (
+        int(rect.top // tile_size),
+        math.ceil(rect.bottom / tile_size) - 1,
+        int(rect.left // tile_size),
+        math.ceil(rect.right / tile_size) - 1,
+    )
+
+
+class TileGroup(pygame.sprite.Group):
+    # sprite group that also indexes its sprites by (row, col), so collision
+    # queries only look at the tiles under a rect instead of every sprite
+    def __init__(self, tile_size, *sprites):
+        self.tile_size = tile_size
+        self.tiles = {}
+        # the keys of tiles, kept sorted so sprites_in can bisect to a rect
+        self.occupied = []
+        # told through add(sprite) and remove(sprite) as sprites join and
+        # leave, like the EntityTables of utils/entity_store.py
+        self.watchers = []
+        super(TileGroup, self).__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super(TileGroup, self).add_internal(sprite, layer)
+        tile = (sprite.row, sprite.col)
+        sprites = self.tiles.get(tile)
+        if sprites is None:
+            sprites = self.tiles[tile] = {}
+            bisect.insort(self.occupied, tile)
+        sprites[sprite] = None
+        for watcher in self.watchers:
+            watcher.add(sprite)
+
+    def remove_internal(self, sprite):
+        super(TileGroup, self).remove_internal(sprite)
+        for watcher in self.watchers:
+            watcher.remove(sprite)
+        tile = (sprite.row, sprite.col)
+        sprites = self.tiles[tile]
+        del sprites[sprite]
+        if not sprites:
+            del self.tiles[tile]
+            del self.occupied[bisect.bisect_left(self.occupied, tile)]
+
+    def sprites_at(self, row, col):
+        return self.tiles.get((row, col), ())
+
+    def sprites_in(self, rect):
+        # in row-major tile order either way
+        first_row, last_row, first_col, last_col = tile_range(rect, self.tile_size)
+        sprites = []
+        if len(self.tiles) < (last_row - first_row + 1) * (last_col - first_col + 1):
+            # fewer occupied tiles than tiles under the rect, e.g. a viewport
+            occupied = self.occupied
+            start = bisect.bisect_left(occupied, (first_row, first_col))
+            stop = bisect.bisect_right(occupied, (last_row, last_col))
+            for tile in occupied[start:stop]:
+                if first_col <= tile[1] <= last_col:
+                    sprites.extend(self.tiles[tile])
+            return sprites
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                tile_sprites = self.tiles.get((row, col))
+                if tile_sprites:
+                    sprites.extend(tile_sprites)
+        return sprites
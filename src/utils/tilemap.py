@@ -0,0 +1,184 @@
+import mmap
+import os
+import struct
+
+from utils.types import Assets, Blocks, Obstacles
+
+# a map file is HEADER followed by rows * cols TILE records in row-major
+# order; a tile is (type, variant) where type 0 is an empty tile and the
+# variant indexes into the enum of that type
+MAGIC = b"BNBM"
+VERSION = 1
+HEADER = struct.Struct("<4sBHH")
+TILE = struct.Struct("<BB")
+
+# codes are written to disk, only ever append to these
+TILE_TYPES = (None, Assets.BLOCKS, Assets.OBSTACLES)
+TILE_VARIANTS = {
+    Assets.BLOCKS: list(Blocks),
+    Assets.OBSTACLES: list(Obstacles),
+}
+
+# a map pack is PACK_HEADER, then one PACK_ENTRY per map, then the map files
+# back to back; entries point at a map's offset and length in the pack
+PACK_MAGIC = b"BNBP"
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct("<4sBI")
+PACK_ENTRY = struct.Struct("<32sII")
+
+MAP_EXTENSION = ".map"
+TILEMAP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "..", "tilemaps"
+)
+MAP_PACK_PATH = os.path.join(TILEMAP_DIR, "maps.pack")
+
+
+class TileMapError(Exception):
+    pass
+
+
+def encode_tile_map(tile_map):
+    rows = len(tile_map)
+    cols = len(tile_map[0]) if rows else 0
+    parts = [HEADER.pack(MAGIC, VERSION, rows, cols)]
+    for row in tile_map:
+        if len(row) != cols:
+            raise TileMapError("tile map rows differ in length")
+        for tile in row:
+            if tile is None:
+                parts.append(TILE.pack(0, 0))
+                continue
+            asset_type, asset_name = tile
+            try:
+                type_code = TILE_TYPES.index(asset_type)
+                variant = TILE_VARIANTS[TILE_TYPES[type_code]].index(asset_name)
+            except (ValueError, KeyError):
+                raise TileMapError(f"unknown tile {asset_type}/{asset_name}")
+            parts.append(TILE.pack(type_code, variant))
+    return b"".join(parts)
+
+
+def decode_tile_map(data, offset=0, length=None):
+    if length is None:
+        length = len(data) - offset
+    if length < HEADER.size:
+        raise TileMapError("tile map too short")
+    magic, version, rows, cols = HEADER.unpack_from(data, offset)
+    if magic != MAGIC:
+        raise TileMapError("not a tile map")
+    if version != VERSION:
+        raise TileMapError(f"unsupported tile map version {version}")
+    if length != HEADER.size + rows * cols * TILE.size:
+        raise TileMapError("tile map size does not match its dimensions")
+
+    tiles = bytes(data[offset + HEADER.size : offset + length])
+    tile_map = []
+    for row in range(rows):
+        tile_row = []
+        for col in range(row * cols, (row + 1) * cols):
+            type_code, variant = tiles[col * 2], tiles[col * 2 + 1]
+            if type_code == 0:
+                tile_row.append(None)
+                continue
+            if type_code >= len(TILE_TYPES):
+                raise TileMapError(f"unknown tile type {type_code}")
+            asset_type = TILE_TYPES[type_code]
+            variants = TILE_VARIANTS[asset_type]
+            if variant >= len(variants):
+                raise TileMapError(f"unknown {asset_type.value} variant {variant}")
+            tile_row.append([asset_type.value, variants[variant].value])
+        tile_map.append(tile_row)
+    return tile_map
+
+
+def tile_map_path(map_name):
+    return os.path.join(TILEMAP_DIR, map_name + MAP_EXTENSION)
+
+
+def load_tile_map(map_name, map_pack=None):
+    if map_pack is not None and map_name in map_pack:
+        return map_pack.load(map_name)
+    with open(tile_map_path(map_name), "rb") as file:
+        tile_map = decode_tile_map(file.read())
+
+    return tile_map if tile_map else None
+
+
+def save_tile_map(map_name, tile_map):
+    data = encode_tile_map(tile_map)
+    with open(tile_map_path(map_name), "wb") as file:
+        file.write(data)
+
+
+def map_names():
+    return sorted(
+        name[: -len(MAP_EXTENSION)]
+        for name in os.listdir(TILEMAP_DIR)
+        if name.endswith(MAP_EXTENSION)
+    )
+
+
+def write_map_pack(path, tile_maps):
+    names = sorted(tile_maps)
+    blobs = [encode_tile_map(tile_maps[name]) for name in names]
+    offset = PACK_HEADER.size + PACK_ENTRY.size * len(names)
+    parts = [PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(names))]
+    for name, blob in zip(names, blobs):
+        encoded_name = name.encode()
+        if len(encoded_name) > PACK_ENTRY.size - 8:
+            raise TileMapError(f"map name {name} is too long for a map pack")
+        parts.append(PACK_ENTRY.pack(encoded_name, offset, len(blob)))
+        offset += len(blob)
+    with open(path, "wb") as file:
+        file.write(b"".join(parts + blobs))
+
+
+def build_map_pack(path=MAP_PACK_PATH):
+    write_map_pack(path, {name: load_tile_map(name) for name in map_names()})
+
+
+def open_map_pack(path=MAP_PACK_PATH):
+    return MapPack(path) if os.path.exists(path) else None
+
+
+class MapPack:
+    # the pack is mapped read-only, so every process that opens it shares the
+    # same pages; only the index is read up front
+    def __init__(self, path=MAP_PACK_PATH):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = {}
+        try:
+            magic, version, count = PACK_HEADER.unpack_from(self.data)
+            if magic != PACK_MAGIC:
+                raise TileMapError("not a map pack")
+            if version != PACK_VERSION:
+                raise TileMapError(f"unsupported map pack version {version}")
+            for i in range(count):
+                name, offset, length = PACK_ENTRY.unpack_from(
+                    self.data, PACK_HEADER.size + i * PACK_ENTRY.size
+                )
+                if offset + length > len(self.data):
+                    raise TileMapError("map pack entry out of bounds")
+                self.index[name.rstrip(b"\0").decode()] = (offset, length)
+        except struct.error:
+            self.close()
+            raise TileMapError("truncated map pack")
+        except TileMapError:
+            self.close()
+            raise
+
+    def __contains__(self, map_name):
+        return map_name in self.index
+
+    def names(self):
+        return sorted(self.index)
+
+    def load(self, map_name):
+        if map_name not in self.index:
+            raise KeyError(f"map {map_name} is not in the map pack")
+        offset, length = self.index[map_name]
+        return decode_tile_map(self.data, offset, length)
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+
+import pygame
+
+
+class TransformCache:
+    # bounded LRU of transformed copies of frames, each built the first time
+    # it is asked for. alpha is rounded to one of alpha_buckets levels so a
+    # fade shares a handful of surfaces instead of making one every frame
+    def __init__(self, max_bytes=32 * 1024 * 1024, alpha_buckets=16):
+        self.max_bytes = max_bytes
+        self.alpha_step = 255 / (alpha_buckets - 1)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def alpha_bucket(self, alpha):
+        alpha = max(0, min(255, alpha))
+        return round(round(alpha / self.alpha_step) * self.alpha_step)
+
+    def get(self, frame, scale=1, flip_x=False, flip_y=False, rotation=0, alpha=255):
+        rotation %= 360
+        alpha = self.alpha_bucket(alpha)
+        if scale == 1 and not flip_x and not flip_y and not rotation and alpha == 255:
+            return frame
+
+        key = (frame, scale, flip_x, flip_y, rotation, alpha)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = frame
+        if scale != 1:
+            surface = pygame.transform.smoothscale_by(surface, scale)
+        if flip_x or flip_y:
+            surface = pygame.transform.flip(surface, flip_x, flip_y)
+        if rotation:
+            surface = pygame.transform.rotate(surface, rotation)
+        if alpha != 255:
+            if surface is frame:
+                surface = frame.copy()
+            surface.set_alpha(alpha)
+
+        self.entries[key] = surface
+        self.bytes += self.size_of(surface)
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= self.size_of(evicted)
+            self.evictions += 1
+        return surface
+
+    def size_of(self, surface):
+        return surface.get_pitch() * surface.get_height()
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
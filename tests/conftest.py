@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# the game runs from the repo root with src/ on the path, utils/config.py
+# reads game_config.json from the working directory on import
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+
+@pytest.fixture(scope="session", autouse=True)
+def display():
+    # convert_alpha() needs a display
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    yield
+    pygame.quit()
@@ -0,0 +1,32 @@
+from simulation import Simulation
+from utils.tilemap import load_tile_map, open_map_pack
+from utils.types import Items
+
+
+def drop_needle(grid, asset_store):
+    item = grid.item_pools[Items.NEEDLE].acquire(
+        asset_store, 0, 0, Items.NEEDLE, grid.items
+    )
+    grid.item_group.add(item)
+    return item
+
+
+def test_needles_go_back_to_the_pool_once_used_up_or_pushed_out():
+    simulation = Simulation(load_tile_map("test", open_map_pack()), [0], seed=0)
+    grid = simulation.grid
+    pool = grid.item_pools[Items.NEEDLE]
+    player = grid.get_player(0)
+
+    for _ in range(6):
+        player.pick_up_item(drop_needle(grid, simulation.asset_store))
+    # the inventory holds five, the oldest was pushed out
+    assert len(player.inventory) == 5
+    assert pool.stats()["in_use"] == 5
+
+    player.is_trapped = True
+    player.use_item(0)
+    assert pool.stats()["in_use"] == 4
+    assert pool.stats()["free"] == 2
+
+    # a needle from the pool is not one still in the inventory
+    assert drop_needle(grid, simulation.asset_store) not in player.inventory
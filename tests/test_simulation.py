@@ -0,0 +1,61 @@
+import json
+import random
+
+from bots import RandomBot
+from simulation import Simulation
+from utils.entity_store import EntityStore
+from utils.tilemap import load_tile_map, open_map_pack
+
+
+def new_simulation(player_ids, entity_store=None):
+    return Simulation(
+        load_tile_map("test", open_map_pack()),
+        player_ids,
+        seed=0,
+        entity_store=entity_store,
+    )
+
+
+def test_joining_leaves_other_players_where_they_are():
+    simulation = new_simulation([0])
+    player = simulation.grid.get_player(0)
+    player.rect.topleft = (0, 180)
+    player.update_hitbox()
+
+    joined = simulation.add_player(1)
+
+    assert player.rect.topleft == (0, 180)
+    assert not joined.rect.colliderect(player.rect)
+
+
+def test_joining_after_a_leave_takes_a_free_corner():
+    simulation = new_simulation([0, 1, 2])
+    simulation.remove_player(1)
+
+    simulation.add_player(3)
+
+    players = simulation.grid.player_group.sprites()
+    assert len(players) == 3
+    for player in players:
+        for other in players:
+            assert other is player or not other.rect.colliderect(player.rect)
+
+
+def test_entity_store_plays_the_same_match():
+    # with a store Grid.update reads the columns instead of the sprites
+    simulations = [new_simulation(range(4)), new_simulation(range(4), EntityStore())]
+    bots = [
+        [
+            RandomBot(player_id, random.Random(player_id), drop_chance=0.05)
+            for player_id in range(4)
+        ]
+        for _ in simulations
+    ]
+    for tick in range(3000):
+        for simulation, match_bots in zip(simulations, bots):
+            for bot in match_bots:
+                bot.act(simulation)
+            simulation.step()
+        if tick % 100 == 0:
+            states = [json.dumps(simulation.state()) for simulation in simulations]
+            assert states[0] == states[1], f"differs at tick {tick}"
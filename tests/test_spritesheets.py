@@ -0,0 +1,95 @@
+import json
+import os
+import random
+
+import pygame
+
+from utils.spritesheets import Spritesheet
+
+BUBBLES = os.path.join("assets", "spritesheets", "bubbles", "default")
+
+
+def replace_ignore_colors_per_pixel(sheet, config):
+    # the get_at/set_at loop PixelArray.replace took over from
+    sheet.set_colorkey(config["colorkey"])
+    width = sheet.get_size()[0]
+    height = sheet.get_size()[1]
+    for x in range(width):
+        for y in range(height):
+            for color in config["ignore_colors"]:
+                if tuple(sheet.get_at((x, y))) == pygame.Color(color):
+                    sheet.set_at((x, y), config["colorkey"])
+                    break
+
+
+def per_pixel_sprites(path, config_path, output_size):
+    spritesheet = Spritesheet(path, config_path)
+    sheet = pygame.image.load(path).convert_alpha()
+    replace_ignore_colors_per_pixel(sheet, spritesheet.config)
+    spritesheet.sheet = sheet
+    spritesheet.width, spritesheet.height = sheet.get_size()
+    # the sheet is already recoloured, only slice and scale it
+    spritesheet.config = dict(spritesheet.config)
+    del spritesheet.config["ignore_colors"]
+    return sheet, spritesheet.get_sprites(*output_size)
+
+
+def assert_same(path, config_path, output_size):
+    spritesheet = Spritesheet(path, config_path)
+    sprites = spritesheet.get_sprites(*output_size)
+    sheet, expected = per_pixel_sprites(path, config_path, output_size)
+
+    assert pygame.image.tobytes(spritesheet.sheet, "RGBA") == pygame.image.tobytes(
+        sheet, "RGBA"
+    )
+    assert [len(row) for row in sprites] == [len(row) for row in expected]
+    for row, expected_row in zip(sprites, expected):
+        for sprite, expected_sprite in zip(row, expected_row):
+            assert sprite.get_size() == expected_sprite.get_size()
+            assert pygame.image.tobytes(sprite, "RGBA") == pygame.image.tobytes(
+                expected_sprite, "RGBA"
+            )
+
+
+def test_ignore_colors_match_per_pixel_loop_on_bubbles_sheet():
+    assert_same(
+        os.path.join(BUBBLES, "default.png"),
+        os.path.join(BUBBLES, "config.json"),
+        (72, 72),
+    )
+
+
+def test_ignore_colors_match_per_pixel_loop_on_synthetic_sheet(tmp_path):
+    colorkey = [26, 122, 62, 255]
+    ignore_colors = [[36, 82, 59], [200, 10, 10], [0, 0, 0]]
+    # the ignore colours exactly, with other alphas and one step off, the
+    # colorkey itself and noise
+    palette = [pygame.Color(*color) for color in ignore_colors]
+    palette += [pygame.Color(*color, 128) for color in ignore_colors]
+    palette += [pygame.Color(*color, 0) for color in ignore_colors]
+    palette += [pygame.Color(color[0] + 1, *color[1:]) for color in ignore_colors]
+    palette.append(pygame.Color(colorkey))
+    rng = random.Random(0)
+    sheet = pygame.Surface((64, 32), pygame.SRCALPHA)
+    for x in range(64):
+        for y in range(32):
+            if rng.random() < 0.7:
+                color = rng.choice(palette)
+            else:
+                color = pygame.Color(*(rng.randrange(256) for _ in range(4)))
+            sheet.set_at((x, y), color)
+    path = str(tmp_path / "sheet.png")
+    pygame.image.save(sheet, path)
+    config_path = str(tmp_path / "config.json")
+    with open(config_path, "w") as file:
+        json.dump(
+            {
+                "rows": 2,
+                "cols": 4,
+                "colorkey": colorkey,
+                "ignore_colors": ignore_colors,
+            },
+            file,
+        )
+
+    assert_same(path, config_path, (16, 16))